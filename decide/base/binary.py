@@ -0,0 +1,175 @@
+'''
+Binary wire format for the ciphertexts exchanged between modules.
+
+The big ints are sent as fixed-width big-endian bytes instead of JSON
+decimal numbers, that are bigger and slow to convert. The container is:
+
+    magic | meta length (u32) | meta json | arity (u8) | width (u32) |
+    count (u32) | count * arity ints of width bytes
+
+The meta json is {"key": key, "data": data}, with the rest of the data.
+The ints block is the data itself if key is "", the data[key] value if key
+is a string, and there're no ints if key is null.
+
+The ints block can be also an object with a wire_block method, like
+mixnet.batch.CiphertextBatch, that is sent without converting the ints,
+and loads can return it with the batch argument.
+
+>>> loads(dumps([[1, 2], [3, 2 ** 100]]))
+[[1, 2], [3, 1267650600228229401496703205376]]
+>>> loads(dumps({'msgs': [5, 6], 'pk': {'p': 7}}))
+{'pk': {'p': 7}, 'msgs': [5, 6]}
+>>> loads(dumps({'detail': 'error'}))
+{'detail': 'error'}
+>>> loads(dumps([]))
+[]
+'''
+
+import json
+import struct
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+
+MEDIA_TYPE = 'application/x-decide-ciphers'
+
+MAGIC = b'DCB1'
+
+HEADER = '>BII'
+
+
+def ints_arity(value):
+    '''
+    Returns the arity of the list of ints or lists of ints value, 0 for an
+    empty list, or None if value can't be packed
+    '''
+
+    if not isinstance(value, (list, tuple)):
+        return None
+    if not value:
+        return 0
+
+    first = value[0]
+    if isinstance(first, int):
+        ok = all(isinstance(v, int) and v >= 0 for v in value)
+        return 1 if ok else None
+    if not isinstance(first, (list, tuple)) or len(first) < 2:
+        return None
+    n = len(first)
+    ok = all(isinstance(v, (list, tuple)) and len(v) == n and
+             all(isinstance(i, int) and i >= 0 for i in v) for v in value)
+    return n if ok else None
+
+
+def ints_block(value):
+    '''
+    (arity, width, count, bytes) of the ints block for value, or None if
+    value can't be packed
+    '''
+
+    if hasattr(value, 'wire_block'):
+        return value.wire_block()
+
+    arity = ints_arity(value)
+    if arity is None:
+        return None
+    if arity == 1:
+        values = value
+    else:
+        values = [i for m in value for i in m]
+    width = max((max(values).bit_length() + 7) // 8, 1) if values else 1
+    ints = b''.join(int(v).to_bytes(width, 'big') for v in values)
+    return arity, width, len(value), ints
+
+
+def to_json(data):
+    '''
+    data with the batches, see ints_block, as lists to send it as JSON
+    '''
+
+    if hasattr(data, 'tolist'):
+        return data.tolist()
+    if isinstance(data, dict) and hasattr(data.get('msgs'), 'tolist'):
+        return dict(data, msgs=data['msgs'].tolist())
+    return data
+
+
+def dumps(data):
+    key, rest = None, data
+    block = ints_block(data)
+    if block is not None:
+        key, rest = '', None
+    elif isinstance(data, dict) and 'msgs' in data:
+        block = ints_block(data['msgs'])
+        if block is not None:
+            key = 'msgs'
+            rest = {k: v for k, v in data.items() if k != 'msgs'}
+
+    arity, width, count, ints = block or (0, 1, 0, b'')
+    meta = json.dumps({'key': key, 'data': rest}).encode('utf-8')
+    return b''.join([MAGIC, struct.pack('>I', len(meta)), meta,
+                     struct.pack(HEADER, arity, width, count), ints])
+
+
+def loads(data, batch=None):
+    '''
+    Inverse of dumps. With batch, the ints block is returned as
+    batch(arity, width, count, data) instead of a list, with data a view
+    of the ints, like mixnet.batch.CiphertextBatch.from_wire.
+    '''
+
+    data = memoryview(data)
+    if bytes(data[:4]) != MAGIC:
+        raise ValueError('bad magic')
+    pos = 4
+    n, = struct.unpack_from('>I', data, pos)
+    pos += 4
+    meta = json.loads(bytes(data[pos:pos + n]).decode('utf-8'))
+    pos += n
+    arity, width, count = struct.unpack_from(HEADER, data, pos)
+    pos += struct.calcsize(HEADER)
+
+    if len(data) - pos != arity * width * count:
+        raise ValueError('bad length')
+    values = [int.from_bytes(data[i:i + width], 'big')
+              for i in range(pos, len(data), width)] if batch is None else []
+    if batch is not None:
+        msgs = batch(arity, width, count, data[pos:])
+    elif arity == 1:
+        msgs = values
+    elif arity:
+        msgs = [values[i:i + arity] for i in range(0, len(values), arity)]
+    else:
+        msgs = []
+
+    key, rest = meta['key'], meta['data']
+    if key is None:
+        return rest
+    if key == '':
+        return msgs
+    rest[key] = msgs
+    return rest
+
+
+class BinaryParser(BaseParser):
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except (ValueError, struct.error) as e:
+            raise ParseError('Binary parse error - %s' % e)
+
+
+class BinaryRenderer(BaseRenderer):
+    media_type = MEDIA_TYPE
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_auto_20180921_1119'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='precomp',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
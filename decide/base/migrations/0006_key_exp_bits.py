@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_key_curve'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='exp_bits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -34,6 +34,14 @@ class Key(models.Model):
     g = BigBigField()
     y = BigBigField()
     x = BigBigField(blank=True, null=True)
+    # precomputed data for this key, like the mixnet fixed-base tables
+    precomp = models.BinaryField(blank=True, null=True)
+    # elliptic curve name for EC ElGamal keys, see mixnet.ecgroup, empty
+    # for finite field ElGamal keys
+    curve = models.CharField(max_length=20, blank=True, default='')
+    # bits of the private key and the encryption exponents, 0 for exponents
+    # in the whole order q subgroup, see mixnet.mixcrypt.exp_bound
+    exp_bits = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         if self.x:
@@ -1,7 +1,32 @@
+import hashlib
+import hmac
+import json as jsonlib
 import urllib
+import uuid
 import requests
 from django.conf import settings
 
+from .binary import MEDIA_TYPE, dumps, loads, to_json
+
+
+# base urls that doesn't support the binary format, see query
+JSON_ONLY = set()
+
+
+def wants_binary(mod, kwargs):
+    return kwargs.get('binary', False) and settings.BINARY_WIRE and mod not in JSON_ONLY
+
+
+def data(response):
+    '''
+    Returns the data of the response, in JSON or in the binary format
+    '''
+
+    headers = getattr(response, 'headers', response)
+    if headers.get('Content-Type', '').startswith(MEDIA_TYPE):
+        return loads(response.content)
+    return response.json()
+
 
 def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     '''
@@ -21,6 +46,11 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     you can complete the query with GET params using the **params** keyword
     and with json data, using the **json** keyword.
 
+    With **binary** the data is sent and received in the binary format of
+    base.binary, with JSON as fallback if the other module doesn't
+    support it. With **response** use the data function to read the
+    response.
+
     Examples
 
     >>> r = query('voting', params={'id': 1})
@@ -42,6 +72,10 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     if 'HTTP_AUTHORIZATION' in kwargs:
         headers['Authorization'] = kwargs['HTTP_AUTHORIZATION']
 
+    binary = wants_binary(mod, kwargs)
+    if binary:
+        headers['Accept'] = '{}, application/json;q=0.5'.format(MEDIA_TYPE)
+
     params = kwargs.get('params', None)
     if params:
         url += '?{}'.format(urllib.parse.urlencode(params))
@@ -50,12 +84,21 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
         response = q(url, headers=headers)
     else:
         json_data = kwargs.get('json', {})
-        response = q(url, json=json_data, headers=headers)
+        if binary:
+            bin_headers = dict(headers, **{'Content-Type': MEDIA_TYPE})
+            response = q(url, data=dumps(json_data), headers=bin_headers)
+            if response.status_code == 415:
+                # unsupported media type, JSON from now on
+                JSON_ONLY.add(mod)
+                headers.pop('Accept')
+                binary = False
+        if not binary:
+            response = q(url, json=to_json(json_data), headers=headers)
 
     if kwargs.get('response', False):
         return response
     else:
-        return response.json()
+        return data(response)
 
 
 def get(*args, **kwargs):
@@ -66,6 +109,43 @@ def post(*args, **kwargs):
     return query(*args, method='post', **kwargs)
 
 
+def post_chunks(modname, msgs, size, json=None, **kwargs):
+    '''
+    Posts the msgs in chunks of size, with the mixnet stream protocol: each
+    post has the json data, the stream id, the chunk index, the number of
+    chunks and the chunk msgs. Returns the result of the last post.
+
+    It stops at the first chunk that fails, and returns its response with
+    **response**, or raises a ValueError without it.
+    '''
+
+    want_response = kwargs.pop('response', False)
+    stream = uuid.uuid4().hex
+    chunks = [msgs[i:i + size] for i in range(0, len(msgs), size)] or [[]]
+    for i, chunk in enumerate(chunks):
+        body = dict(json or {}, stream=stream, chunk=i, chunks=len(chunks),
+                    msgs=chunk)
+        r = post(modname, json=body, response=True, **kwargs)
+        if r.status_code != 200:
+            if want_response:
+                return r
+            raise ValueError('chunk {} of {} failed with {}'.format(
+                             i, len(chunks), r.status_code))
+    return r if want_response else data(r)
+
+
+def call_signature(path, data):
+    '''
+    HMAC, with the MIXNET_AUTH_SECRET shared by the voting and the mixnet
+    auths, of the path, the position and the msgs of a mixnet call, see
+    mixnet.views.PartialDecrypt
+    '''
+
+    msg = jsonlib.dumps([path, data.get("position", 0), to_json(data.get("msgs", []))])
+    secret = settings.MIXNET_AUTH_SECRET.encode('utf-8')
+    return hmac.new(secret, msg.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
 def mock_query(client):
     '''
     Function to build a mock to override the query function in this module.
@@ -81,16 +161,24 @@ def mock_query(client):
 
         q = getattr(client, method)
 
+        extra = {}
+        binary = wants_binary('', kwargs)
+        if binary:
+            extra['HTTP_ACCEPT'] = '{}, application/json;q=0.5'.format(MEDIA_TYPE)
+
         if method == 'get':
-            response = q(url, format='json')
+            response = q(url, format='json', **extra)
         else:
             json_data = kwargs.get('json', {})
-            response = q(url, data=json_data, format='json')
+            if binary:
+                response = q(url, data=dumps(json_data), content_type=MEDIA_TYPE, **extra)
+            else:
+                response = q(url, data=to_json(json_data), format='json')
 
         if kwargs.get('response', False):
             return response
         else:
-            return response.json()
+            return data(response)
 
     global query
     query = test_query
@@ -1,10 +1,12 @@
 from django.contrib.auth.models import User
+from django.test import override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
 from base import mods
 
 
+@override_settings(MIXNET_TEST_GROUPS=True)
 class BaseTestCase(APITestCase):
 
     def setUp(self):
@@ -0,0 +1,126 @@
+// Elliptic curve ElGamal, the same encoding than mixnet/ecgroup.py:
+// the points are ints with the compressed encoding and the messages are
+// encoded as the point with x = m * 256 + i.
+// Needs elgamal.js for the random numbers.
+
+ECElGamal = {};
+ECElGamal.MSG_K = 256;
+
+ECElGamal.CURVES = {
+  'P-256': {
+    p: 'ffffffff00000001000000000000000000000000ffffffffffffffffffffffff',
+    a: 'ffffffff00000001000000000000000000000000fffffffffffffffffffffffc',
+    b: '5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b',
+    n: 'ffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551',
+    gx: '6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296',
+    gy: '4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5',
+  },
+};
+
+ECElGamal.getCurve = function(name) {
+  var params = ECElGamal.CURVES[name];
+  var c = {};
+  for (var k in params) {
+    c[k] = new BigInt(params[k], 16);
+  }
+  c.G = {x: c.gx, y: c.gy};
+  c.size = (c.p.bitLength() + 7) >> 3;
+  return c;
+};
+
+// points are {x, y} and null is the infinity
+ECElGamal.add = function(c, P, Q) {
+  if (!P) return Q;
+  if (!Q) return P;
+
+  var l;
+  if (P.x.equals(Q.x)) {
+    if (!P.y.equals(Q.y) || P.y.signum() == 0)
+      return null;
+    // doubling, l = (3x^2 + a) / 2y
+    var num = P.x.multiply(P.x).multiply(BigInt.fromInt(3)).add(c.a);
+    l = num.multiply(P.y.shiftLeft(1).modInverse(c.p)).mod(c.p);
+  } else {
+    var dy = Q.y.subtract(P.y);
+    l = dy.multiply(Q.x.subtract(P.x).mod(c.p).modInverse(c.p)).mod(c.p);
+  }
+
+  var x = l.multiply(l).subtract(P.x).subtract(Q.x).mod(c.p);
+  var y = l.multiply(P.x.subtract(x)).subtract(P.y).mod(c.p);
+  return {x: x, y: y};
+};
+
+ECElGamal.mul = function(c, k, P) {
+  var R = null;
+  for (var i = k.bitLength() - 1; i >= 0; i--) {
+    R = ECElGamal.add(c, R, R);
+    if (k.testBit(i))
+      R = ECElGamal.add(c, R, P);
+  }
+  return R;
+};
+
+ECElGamal.sqrt = function(c, v) {
+  // p = 3 mod 4
+  var e = c.p.add(BigInt.ONE).shiftRight(2);
+  var r = v.modPow(e, c.p);
+  if (!r.multiply(r).mod(c.p).equals(v.mod(c.p)))
+    return null;
+  return r;
+};
+
+ECElGamal.rhs = function(c, x) {
+  return x.multiply(x).multiply(x).add(c.a.multiply(x)).add(c.b).mod(c.p);
+};
+
+ECElGamal.encode = function(c, P) {
+  if (!P) return BigInt.ZERO;
+  var prefix = BigInt.fromInt(P.y.testBit(0) ? 3 : 2);
+  return prefix.shiftLeft(8 * c.size).or(P.x);
+};
+
+ECElGamal.decode = function(c, n) {
+  var x = n.and(BigInt.ONE.shiftLeft(8 * c.size).subtract(BigInt.ONE));
+  var odd = n.shiftRight(8 * c.size).testBit(0);
+  var y = ECElGamal.sqrt(c, ECElGamal.rhs(c, x));
+  if (!y)
+    throw "Invalid point encoding";
+  if (y.testBit(0) != odd)
+    y = c.p.subtract(y);
+  return {x: x, y: y};
+};
+
+ECElGamal.encodeMsg = function(c, m) {
+  var base = m.multiply(BigInt.fromInt(ECElGamal.MSG_K));
+  for (var i = 0; i < ECElGamal.MSG_K; i++) {
+    var x = base.add(BigInt.fromInt(i));
+    var y = ECElGamal.sqrt(c, ECElGamal.rhs(c, x));
+    if (y)
+      return {x: x, y: y};
+  }
+  throw "Can't encode the message";
+};
+
+// pk is {curve: name, y: BigInt}, M is a point
+ECElGamal.encryptPoint = function(pk, M, r) {
+  var c = ECElGamal.getCurve(pk.curve);
+  if (!r)
+    r = ElGamal.getRandomInteger(c.n.subtract(BigInt.ONE)).add(BigInt.ONE);
+
+  var Y = ECElGamal.decode(c, pk.y);
+  var alpha = ECElGamal.mul(c, r, c.G);
+  var beta = ECElGamal.add(c, ECElGamal.mul(c, r, Y), M);
+
+  return { alpha: ECElGamal.encode(c, alpha), beta: ECElGamal.encode(c, beta) };
+};
+
+ECElGamal.encrypt = function(pk, m, r) {
+  var c = ECElGamal.getCurve(pk.curve);
+  return ECElGamal.encryptPoint(pk, ECElGamal.encodeMsg(c, m), r);
+};
+
+// exponential ElGamal, encrypts m * G
+ECElGamal.encryptExp = function(pk, m, r) {
+  var c = ECElGamal.getCurve(pk.curve);
+  return ECElGamal.encryptPoint(pk, ECElGamal.mul(c, m, c.G), r);
+};
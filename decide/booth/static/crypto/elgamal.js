@@ -16,9 +16,13 @@ ElGamal.encrypt = function(pk, m, r) {
     throw "Can't encrypt 0 with El Gamal"
 
   if (!r) {
-    let q = BigInt.fromInt(2).pow(ElGamal.BITS);
+    // r in [1, q-1], with q the order of the subgroup of the safe prime p,
+    // or a short exponent of pk.exp_bits bits, like mixnet.mixcrypt.rands
+    let q = pk.p.subtract(BigInt.ONE).shiftRight(1);
+    if (pk.exp_bits && pk.exp_bits < q.bitLength())
+      q = BigInt.ONE.shiftLeft(pk.exp_bits);
     let q1 = q.subtract(BigInt.ONE);
-    r = ElGamal.getRandomInteger(q1);
+    r = ElGamal.getRandomInteger(q1).add(BigInt.ONE);
   }
 
   var alpha = pk.g.modPow(r, pk.p);
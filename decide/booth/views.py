@@ -52,9 +52,9 @@ class BoothView(TemplateView):
 
             context['voting'] = json.dumps(r[0])
             context['question'] = json.dumps(r[0]['question'][current_q_pos])
+            # the key size of the voting crypto profile
+            context['KEYBITS'] = r[0].get('keybits') or settings.KEYBITS
         except:
             raise Http404('This voting does not exist')
 
-        context['KEYBITS'] = settings.KEYBITS
-
         return context
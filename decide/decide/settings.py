@@ -52,7 +52,18 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ),
-    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.QueryParameterVersioning'
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.QueryParameterVersioning',
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'base.binary.BinaryParser',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'base.binary.BinaryRenderer',
+    ),
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -165,6 +176,96 @@ STATIC_URL = '/static/'
 # number of bits for the key, all auths should use the same number of bits
 KEYBITS = 256
 
+# use the small groups of mixnet.groups.TEST_GROUPS, under 2048 bits, for
+# the keys of that size. They're too weak for a real voting, only for the
+# tests and development, without them a new group is generated
+MIXNET_TEST_GROUPS = False
+
+# allow votings with the homomorphic tally mode. Its ballots have an
+# encryption of g^1 or g^0 for each option, but there're no proofs of it,
+# so the store only checks the options, and a modified client could vote
+# g^k or several options and change the result. Only for trusted clients
+HOMOMORPHIC_TRUSTED_CLIENTS = False
+
+# store the mixnet fixed-base tables with the public key, so every process
+# can load them instead of building them again. Only for the mixnet own
+# keys, the tables of the keys sent by the caller aren't stored
+MIXNET_STORE_TABLES = True
+
+# number of processes used by the mixnet to shuffle and decrypt, with 0 or 1
+# everything is done in the request process
+MIXNET_WORKERS = 0
+
+# generate the mixnet reencryption factors while the voting is open, so the
+# shuffle after the voting close is faster
+MIXNET_PRECOMPUTE = True
+
+# number of keys generated in background, ready for the next votings. It's
+# only needed for KEYBITS without group parameters in mixnet.groups or in
+# the GroupParams table, see the mixnet_genparams command
+MIXNET_KEY_POOL = 0
+
+# send the ciphertexts between modules with the binary format of
+# base.binary instead of JSON, if the other module supports it
+BINARY_WIRE = False
+
+# number of ciphertexts of each chunk sent to the mixnet in the tally, so
+# the auths of the chain work at the same time with different chunks, see
+# Mixnet.stream. With 0 all the ciphertexts are sent at once
+MIXNET_STREAM_CHUNK = 0
+
+# run the tally shuffle and decrypt as mixnet jobs: each auth returns at
+# once and sends the result to the next one in background, and the voting
+# polls the first auth every MIXNET_JOB_POLL seconds for the result, until
+# MIXNET_JOB_TIMEOUT seconds
+MIXNET_ASYNC = False
+MIXNET_JOB_POLL = 2
+MIXNET_JOB_TIMEOUT = 3600
+
+# shuffle and decrypt the votes in one pass through the mixnet chain, see
+# mixnet.views.MixDecrypt
+MIXNET_COMBINED = False
+
+# the last mixnet auth returns the number of votes of each option instead
+# of all the votes, that are stored in the voting only with MIXNET_AUDIT
+MIXNET_HISTOGRAM = False
+MIXNET_AUDIT = False
+
+# the first mixnet auth asks all the other auths for their key at the same
+# time, instead of a chained call through all the auths
+MIXNET_FANOUT_KEYGEN = False
+
+# decrypt the shuffled votes, and the homomorphic aggregates, with all the
+# mixnet auths working at the same time, see mixnet.views.PartialDecrypt.
+# Only without MIXNET_COMBINED, that decrypts in the shuffle pass
+MIXNET_PARALLEL_DECRYPT = False
+
+# secret shared by the voting and all the mixnet auths, that sign with it
+# the calls of the parallel decryption, see mixnet.views.PartialDecrypt.
+# The auths of a voting in different servers need the same one
+MIXNET_AUTH_SECRET = SECRET_KEY
+
+# bits of the mixnet private keys and of the encryption and reencryption
+# exponents, for safe prime groups. With 0 they're in [1, q-1], the order q
+# subgroup, and short exponents like 256 with 2048 bits keys make all the
+# exponentiations several times faster
+MIXNET_EXPONENT_BITS = 0
+
+# number of keys with its MixCrypt, validated key and fixed-base tables
+# cached in each process, see mixnet.keycache. 0 to disable the cache
+MIXNET_KEY_CACHE = 32
+
+# the mixnet moves the ballot boxes with more than MIXNET_DISK_BATCH
+# ciphertexts to a memory-mapped temporary file in MIXNET_DISK_DIR, the
+# system one if it's None, see mixnet.batch.DiskBatch. 0 to disable it
+MIXNET_DISK_BATCH = 0
+MIXNET_DISK_DIR = None
+
+# each mixnet auth stores the result of its hop until the chain is done,
+# and the voting the result of each tally step, so a failed tally retried
+# with the same votes resumes from the last finished hop or chunk
+MIXNET_CHECKPOINTS = False
+
 # Versioning
 ALLOWED_VERSIONS = ['v1', 'v2']
 DEFAULT_VERSION = 'v1'
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Mixnet
+from .models import Mixnet, GroupParams
 
 
 admin.site.register(Mixnet)
+admin.site.register(GroupParams)
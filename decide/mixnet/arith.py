@@ -0,0 +1,94 @@
+'''
+Big integer arithmetic used by mixcrypt.
+
+There're two backends, GMPBackend that uses gmpy2 and PythonBackend that
+uses the builtin python ints. The GMP one is much faster with big keys and
+it's used if gmpy2 is installed.
+
+>>> b = get_backend('python')
+>>> b.name
+'python'
+>>> b.powmod(3, 5, 7), b.invert(3, 7)
+(5, 5)
+>>> get_backend().name in ('gmp', 'python')
+True
+>>> batch_invert([2, 3, 5], 7) == [b.invert(i, 7) for i in (2, 3, 5)]
+True
+'''
+
+import math
+
+from Crypto.Util.number import inverse
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class PythonBackend:
+    name = 'python'
+
+    mpz = int
+    powmod = staticmethod(pow)
+    invert = staticmethod(inverse)
+    gcd = staticmethod(math.gcd)
+
+
+class GMPBackend(PythonBackend):
+    name = 'gmp'
+
+    if gmpy2:
+        mpz = gmpy2.mpz
+        powmod = staticmethod(gmpy2.powmod)
+        invert = staticmethod(gmpy2.invert)
+        gcd = staticmethod(gmpy2.gcd)
+
+
+BACKENDS = {
+    'python': PythonBackend,
+    'gmp': GMPBackend,
+}
+
+
+def get_backend(name=None):
+    '''
+    Returns the backend by name. Without name the GMP backend is returned
+    if gmpy2 is available and the python one in other case.
+    '''
+
+    if not name:
+        name = 'gmp' if gmpy2 else 'python'
+    if name == 'gmp' and not gmpy2:
+        raise ValueError('gmpy2 is not installed')
+    return BACKENDS[name]
+
+
+# default backend
+backend = get_backend()
+
+
+def batch_invert(values, p, backend=backend):
+    '''
+    Modular inverses of all the values with only one modular inversion,
+    using Montgomery's trick: the product of all values is inverted and
+    each inverse is recovered from it with two multiplications.
+    '''
+
+    if not values:
+        return []
+
+    mpz = backend.mpz
+    prods = []
+    acc = mpz(1)
+    for v in values:
+        acc = (acc * v) % p
+        prods.append(acc)
+
+    inv = backend.invert(acc, p)
+    invs = [None] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        invs[i] = (inv * prods[i - 1]) % p
+        inv = (inv * values[i]) % p
+    invs[0] = inv
+    return invs
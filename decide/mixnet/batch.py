@@ -0,0 +1,399 @@
+'''
+Compact container for a list of ciphertexts, or of any tuples of ints of
+the same arity. The ints are stored as fixed-width big-endian bytes, the
+same layout than the base.binary wire format, so a batch is sent and
+received without converting each int, and it uses about the raw size of
+the ciphertexts instead of the overhead of a Python list of tuples.
+
+>>> b = CiphertextBatch.from_list([[1, 2], [3, 4], [5, 6]])
+>>> len(b), b[1], b[-1]
+(3, (3, 4), (5, 6))
+>>> b[1:].to_list()
+[(3, 4), (5, 6)]
+>>> b.permute([2, 0, 1])
+>>> b.to_list()
+[(5, 6), (1, 2), (3, 4)]
+>>> b.extend([(7, 2 ** 20)])
+>>> len(b), b.width
+(4, 3)
+>>> CiphertextBatch.from_wire(*b.wire_block()).to_list() == b.to_list()
+True
+>>> CiphertextBatch.concat([b[:1], CiphertextBatch.from_list([9])]).to_list()
+Traceback (most recent call last):
+...
+ValueError: different arity
+>>> CiphertextBatch.concat([b[:1], b[3:]]).to_list()
+[(5, 6), (7, 1048576)]
+
+>>> d = DiskBatch(width=3)
+>>> d.extend(b)
+>>> d.permuted([3, 2, 1, 0], bucket=3).to_list()
+[(7, 1048576), (3, 4), (1, 2), (5, 6)]
+>>> import io
+>>> f = io.BytesIO()
+>>> h = d.dump(f)
+>>> d2, h2 = DiskBatch.load(io.BytesIO(f.getvalue()), 3, 2)
+>>> d2.to_list() == d.to_list(), h == h2
+(True, True)
+'''
+
+import hashlib
+import mmap
+import struct
+import tempfile
+from array import array
+
+
+# number of elements of each bucket of DiskBatch.permuted, that are placed
+# in memory
+BUCKET = 1 << 18
+
+# bytes read or written at once by DiskBatch.dump and load
+BLOCK = 1 << 20
+
+
+def int_width(values):
+    '''
+    Number of bytes to store the biggest of values
+    '''
+
+    return max((max(values, default=0).bit_length() + 7) // 8, 1)
+
+
+class CiphertextBatch:
+    on_disk = False
+
+    def __init__(self, width=1, arity=None, data=None):
+        '''
+        width is the number of bytes of each int, arity the number of ints
+        of each element, that is set with the first element if it's None.
+        data is a bytearray, or a memoryview for a read-only view.
+        '''
+
+        self.width = width
+        self.arity = arity
+        self.data = bytearray() if data is None else data
+
+    @classmethod
+    def from_list(cls, msgs, width=None):
+        msgs = list(msgs)
+        if width is None:
+            values = [v for m in msgs for v in (m if isinstance(m, (list, tuple)) else (m, ))]
+            width = int_width(values)
+        batch = cls(width)
+        batch.extend(msgs)
+        return batch
+
+    @classmethod
+    def from_wire(cls, arity, width, count, data):
+        '''
+        Batch view of the ints block of the wire format, without copying
+        it, see base.binary.loads
+        '''
+
+        data = memoryview(data)
+        if len(data) != arity * width * count:
+            raise ValueError('bad length')
+        return cls(width, arity or None, data)
+
+    @classmethod
+    def concat(cls, batches):
+        '''
+        New batch with the elements of all the batches
+        '''
+
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls()
+        if len(set(b.arity for b in batches)) > 1:
+            raise ValueError('different arity')
+
+        width = max(b.width for b in batches)
+        batch = cls(width, batches[0].arity)
+        for b in batches:
+            batch.extend_batch(b)
+        return batch
+
+    def new(self, width=None):
+        '''
+        Empty batch of the same type, in memory or on disk
+        '''
+
+        return self.__class__(width or self.width)
+
+    def wire_block(self):
+        '''
+        (arity, width, count, data) of the ints block of the wire format
+        '''
+
+        return self.arity or 0, self.width, len(self), self.data
+
+    def record_size(self):
+        return (self.arity or 0) * self.width
+
+    def __len__(self):
+        size = self.record_size()
+        return len(self.data) // size if size else 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def get(self, i):
+        w, size = self.width, self.record_size()
+        start = i * size
+        values = tuple(int.from_bytes(self.data[j:j + w], 'big')
+                       for j in range(start, start + size, w))
+        return values[0] if self.arity == 1 else values
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            # a view without copying, so this batch can't grow while the
+            # slice is used
+            start, stop, step = i.indices(n)
+            if step != 1:
+                return CiphertextBatch.from_list((self.get(j) for j in range(start, stop, step)),
+                                                 width=self.width)
+            size = self.record_size()
+            data = memoryview(self.data)[start * size:max(stop, start) * size]
+            return CiphertextBatch(self.width, self.arity, data)
+
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('batch index out of range')
+        return self.get(i)
+
+    def writable(self):
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        return self.data
+
+    def append(self, m):
+        self.extend([m])
+
+    def extend(self, msgs):
+        data = self.writable()
+        w = self.width
+        for m in msgs:
+            if self.arity is None:
+                self.arity = 1 if isinstance(m, int) else len(m)
+            values = (m, ) if self.arity == 1 else m
+            for v in values:
+                v = int(v)
+                if v.bit_length() > 8 * w:
+                    self.widen(int_width([v]))
+                    data, w = self.data, self.width
+                data += v.to_bytes(w, 'big')
+
+    def extend_raw(self, data):
+        '''
+        Adds the elements of data, with the same layout than this batch
+        '''
+
+        self.writable().extend(data)
+
+    def extend_batch(self, batch):
+        if self.arity is None:
+            self.arity = batch.arity
+        if not len(self) and not self.on_disk:
+            self.width = max(self.width, batch.width)
+        if batch.width == self.width and batch.arity == self.arity:
+            self.extend_raw(batch.data)
+        else:
+            self.extend(batch)
+
+    def widen(self, width):
+        '''
+        Stores the ints with width bytes, to add bigger ones
+        '''
+
+        old, data = self.width, self.data
+        pad = bytes(width - old)
+        self.data = bytearray()
+        for i in range(0, len(data), old):
+            self.data += pad + data[i:i + old]
+        self.width = width
+
+    def permute(self, perm):
+        '''
+        Reorders the elements in place, the element j is the old element
+        perm[j], following the permutation cycles
+        '''
+
+        data = self.writable()
+        size = self.record_size()
+        done = bytearray(len(self))
+        for start in range(len(self)):
+            if done[start]:
+                continue
+            tmp = bytes(data[start * size:(start + 1) * size])
+            j = start
+            while True:
+                done[j] = 1
+                k = perm[j]
+                if k == start:
+                    data[j * size:(j + 1) * size] = tmp
+                    break
+                data[j * size:(j + 1) * size] = data[k * size:(k + 1) * size]
+                j = k
+
+    def permuted(self, perm):
+        '''
+        New batch with the element j the element perm[j] of this one
+        '''
+
+        batch = self.copy()
+        batch.permute(perm)
+        return batch
+
+    def copy(self):
+        return self.__class__(self.width, self.arity, bytearray(self.data))
+
+    def to_list(self):
+        return list(self)
+
+    def tolist(self):
+        '''
+        Lists for the JSON encoders, like to_list
+        '''
+
+        return [list(m) if isinstance(m, tuple) else m for m in self]
+
+
+class DiskBatch(CiphertextBatch):
+    '''
+    CiphertextBatch stored in a temporary file and memory-mapped, for
+    ballot boxes bigger than the memory. The elements are appended to the
+    file, so the width can't change, and the file is removed when the
+    batch is collected.
+    '''
+
+    on_disk = True
+
+    def __init__(self, width=1, arity=None, dir=None):
+        self.width = width
+        self.arity = arity
+        self.dir = dir
+        self.file = tempfile.TemporaryFile(dir=dir)
+        self.size = 0
+        self.map = None
+
+    @property
+    def data(self):
+        '''
+        The mmap of the file, mapped again when the file grows. The old
+        mmap is kept while there're views of it.
+        '''
+
+        if not self.size:
+            return b''
+        if self.map is None or len(self.map) != self.size:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), self.size)
+        return self.map
+
+    def new(self, width=None):
+        return self.__class__(width or self.width, dir=self.dir)
+
+    def writable(self):
+        return self.data
+
+    def extend_raw(self, data):
+        self.file.seek(self.size)
+        self.file.write(data)
+        self.size += len(data)
+
+    def extend(self, msgs):
+        buf = bytearray()
+        w = self.width
+        for m in msgs:
+            if self.arity is None:
+                self.arity = 1 if isinstance(m, int) else len(m)
+            values = (m, ) if self.arity == 1 else m
+            for v in values:
+                v = int(v)
+                if v.bit_length() > 8 * w:
+                    raise ValueError('int too big for the batch width')
+                buf += v.to_bytes(w, 'big')
+            if len(buf) >= 1 << 20:
+                self.extend_raw(buf)
+                buf = bytearray()
+        self.extend_raw(buf)
+
+    def widen(self, width):
+        raise ValueError('the width of a DiskBatch can not change')
+
+    def copy(self):
+        batch = self.new()
+        batch.extend_batch(self)
+        return batch
+
+    def dump(self, file):
+        '''
+        Writes the ints of the batch to the file object, without loading
+        them in memory, and returns their sha256
+        '''
+
+        h = hashlib.sha256()
+        data = self.data
+        for start in range(0, self.size, BLOCK):
+            block = data[start:start + BLOCK]
+            h.update(block)
+            file.write(block)
+        return h.hexdigest()
+
+    @classmethod
+    def load(cls, file, width, arity, dir=None):
+        '''
+        New batch with the ints written by dump to the file object, and
+        their sha256
+        '''
+
+        batch = cls(width, arity, dir=dir)
+        h = hashlib.sha256()
+        while True:
+            block = file.read(BLOCK)
+            if not block:
+                break
+            h.update(block)
+            batch.extend_raw(block)
+        return batch, h.hexdigest()
+
+    def permuted(self, perm, bucket=BUCKET):
+        '''
+        New batch with the element j the element perm[j] of this one, with
+        an external memory permutation: the elements are read in order and
+        appended to the file of the bucket of its new position, and then
+        each bucket, that fits in memory, is placed in order.
+        '''
+
+        n, size = len(self), self.record_size()
+        dest = array('Q', bytes(8 * n))
+        for j, i in enumerate(perm):
+            dest[i] = j
+
+        buckets = [tempfile.TemporaryFile(dir=self.dir) for i in range(0, n, bucket)]
+        data = self.data
+        for start in range(0, n, bucket):
+            block = bytes(data[start * size:min(n, start + bucket) * size])
+            outs = [bytearray() for f in buckets]
+            for k in range(len(block) // size):
+                b, j = divmod(dest[start + k], bucket)
+                outs[b] += struct.pack('>I', j) + block[k * size:(k + 1) * size]
+            for f, out in zip(buckets, outs):
+                f.write(out)
+
+        batch = self.__class__(self.width, self.arity, dir=self.dir)
+        rec = 4 + size
+        for b, f in enumerate(buckets):
+            f.seek(0)
+            raw = f.read()
+            f.close()
+            placed = bytearray(len(raw) // rec * size)
+            for off in range(0, len(raw), rec):
+                j, = struct.unpack_from('>I', raw, off)
+                placed[j * size:(j + 1) * size] = raw[off + 4:off + rec]
+            batch.extend_raw(placed)
+        return batch
@@ -0,0 +1,341 @@
+'''
+Elliptic curve arithmetic for the EC ElGamal mixnet, see ECMixCrypt.
+
+The points are (x, y) tuples in affine coordinates and None is the point
+at infinity. The operations are done in jacobian coordinates, so an
+inversion is only needed to get the affine result, and to_affine_batch
+converts a list of points with only one inversion.
+
+Points are exchanged with compressed encoding, as an int, to store them in
+the same fields than the finite field ElGamal numbers.
+
+>>> c = get_curve('P-256')
+>>> c.is_on_curve(c.G)
+True
+>>> c.mul(c.n, c.G) is None
+True
+>>> P = c.mul(12345, c.G)
+>>> c.decode(c.encode(P)) == P
+True
+>>> c.add(P, c.neg(P)) is None
+True
+>>> c.add(c.mul(2, c.G), c.mul(3, c.G)) == c.mul(5, c.G)
+True
+>>> c.decode_msg(c.encode_msg(42))
+42
+'''
+
+try:
+    from .arith import get_backend, batch_invert
+except ImportError:
+    from arith import get_backend, batch_invert
+
+
+# the point at infinity in jacobian coordinates
+INF = (1, 1, 0)
+
+# message encoding, the x coordinate of the point is m * MSG_K + i
+MSG_K = 256
+
+
+class Curve:
+    '''
+    Short Weierstrass curve y^2 = x^3 + ax + b over the prime field p, with
+    a generator G of prime order n
+    '''
+
+    def __init__(self, name, p, a, b, n, gx, gy, backend=None):
+        self.name = name
+        self.p = p
+        self.a = a % p
+        self.b = b
+        self.n = n
+        self.G = (gx, gy)
+        self.size = (p.bit_length() + 7) // 8
+        self.backend = backend or get_backend()
+
+    def is_on_curve(self, P):
+        if P is None:
+            return True
+        x, y = P
+        return (y * y - x * x * x - self.a * x - self.b) % self.p == 0
+
+    def neg(self, P):
+        if P is None:
+            return None
+        return (P[0], (-P[1]) % self.p)
+
+    def double_jacobian(self, P):
+        X, Y, Z = P
+        if not Z or not Y:
+            return INF
+        p = self.p
+        YY = (Y * Y) % p
+        S = (4 * X * YY) % p
+        ZZ = (Z * Z) % p
+        M = (3 * X * X + self.a * ZZ * ZZ) % p
+        X3 = (M * M - 2 * S) % p
+        Y3 = (M * (S - X3) - 8 * YY * YY) % p
+        Z3 = (2 * Y * Z) % p
+        return (X3, Y3, Z3)
+
+    def add_mixed(self, P, Q):
+        '''
+        Adds the jacobian point P and the affine point Q
+        '''
+
+        if Q is None:
+            return P
+        X1, Y1, Z1 = P
+        x2, y2 = Q
+        if not Z1:
+            return (x2, y2, 1)
+
+        p = self.p
+        Z1Z1 = (Z1 * Z1) % p
+        U2 = (x2 * Z1Z1) % p
+        S2 = (y2 * Z1 * Z1Z1) % p
+        H = (U2 - X1) % p
+        r = (S2 - Y1) % p
+        if not H:
+            if not r:
+                return self.double_jacobian(P)
+            return INF
+
+        HH = (H * H) % p
+        HHH = (H * HH) % p
+        V = (X1 * HH) % p
+        X3 = (r * r - HHH - 2 * V) % p
+        Y3 = (r * (V - X3) - Y1 * HHH) % p
+        Z3 = (Z1 * H) % p
+        return (X3, Y3, Z3)
+
+    def to_affine(self, P):
+        return self.to_affine_batch([P])[0]
+
+    def to_affine_batch(self, points):
+        '''
+        Converts the jacobian points to affine with only one inversion
+        '''
+
+        p = self.p
+        zs = [P[2] for P in points if P[2]]
+        invs = iter(batch_invert(zs, p, self.backend))
+        affine = []
+        for X, Y, Z in points:
+            if not Z:
+                affine.append(None)
+                continue
+            zinv = next(invs)
+            zinv2 = (zinv * zinv) % p
+            affine.append((int((X * zinv2) % p), int((Y * zinv2 * zinv) % p)))
+        return affine
+
+    def mul_jacobian(self, k, P):
+        k = int(k) % self.n
+        if P is None or not k:
+            return INF
+        R = INF
+        for bit in bin(k)[2:]:
+            R = self.double_jacobian(R)
+            if bit == '1':
+                R = self.add_mixed(R, P)
+        return R
+
+    def mul(self, k, P):
+        return self.to_affine(self.mul_jacobian(k, P))
+
+    def add(self, P, Q):
+        if P is None:
+            return Q
+        return self.to_affine(self.add_mixed((P[0], P[1], 1), Q))
+
+    def sqrt(self, v):
+        '''
+        Square root modulo p, for p = 3 mod 4, or None
+        '''
+
+        p = self.p
+        r = int(self.backend.powmod(v, (p + 1) // 4, p))
+        if (r * r) % p != v % p:
+            return None
+        return r
+
+    def encode(self, P):
+        '''
+        Compressed encoding of the point as an int, 0 is the infinity
+        '''
+
+        if P is None:
+            return 0
+        x, y = P
+        return ((2 + (y & 1)) << (8 * self.size)) | x
+
+    def decode(self, n):
+        n = int(n)
+        if not n:
+            return None
+        prefix, x = n >> (8 * self.size), n & ((1 << (8 * self.size)) - 1)
+        if prefix not in (2, 3) or x >= self.p:
+            raise ValueError('invalid point encoding')
+        y = self.sqrt((x * x * x + self.a * x + self.b) % self.p)
+        if y is None:
+            raise ValueError('invalid point encoding')
+        if (y & 1) != (prefix & 1):
+            y = self.p - y
+        return (x, y)
+
+    def encode_msg(self, m):
+        '''
+        Encodes the int m as a point with x = m * MSG_K + i
+        '''
+
+        m = int(m)
+        if not 0 <= m < self.p // MSG_K:
+            raise ValueError('message out of range')
+        for i in range(MSG_K):
+            x = m * MSG_K + i
+            y = self.sqrt((x * x * x + self.a * x + self.b) % self.p)
+            if y is not None:
+                return (x, y)
+        raise ValueError('message can not be encoded')
+
+    def decode_msg(self, P):
+        return P[0] // MSG_K
+
+    def dlog(self, P, bound):
+        '''
+        k such as P = kG with k in [0, bound], baby-step giant-step
+        '''
+
+        m = int(bound ** 0.5) + 1
+        baby = {}
+        R = INF
+        jacobians = []
+        for j in range(m):
+            jacobians.append(R)
+            R = self.add_mixed(R, self.G)
+        for j, Q in enumerate(self.to_affine_batch(jacobians)):
+            baby.setdefault(self.encode(Q), j)
+
+        # -mG
+        factor = self.neg(self.mul(m, self.G))
+        gamma = P
+        for i in range(m + 1):
+            j = baby.get(self.encode(gamma))
+            if j is not None and i * m + j <= bound:
+                return i * m + j
+            gamma = self.add(gamma, factor)
+
+        raise ValueError('discrete logarithm not found in [0, {}]'.format(bound))
+
+
+class ECFixedBase:
+    '''
+    Fixed-base scalar multiplication table, like mixcrypt.FixedBase: it
+    stores d * 2^(w*i) * P for each w bits window i and each digit d, so kP
+    is just an addition for each window.
+
+    >>> c = get_curve('P-256')
+    >>> fb = ECFixedBase(c, c.G, window=4)
+    >>> fb.mul(123456789) == c.mul(123456789, c.G)
+    True
+    >>> ECFixedBase.from_bytes(c, fb.to_bytes()).mul(77) == c.mul(77, c.G)
+    True
+    '''
+
+    def __init__(self, curve, P, window=4, table=None):
+        self.curve = curve
+        self.P = P
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.table = table or self.build()
+
+    def build(self):
+        c = self.curve
+        rows = (c.n.bit_length() + self.window - 1) // self.window
+        points = []
+        B = (self.P[0], self.P[1], 1)
+        for i in range(rows):
+            R = INF
+            Baff = c.to_affine(B)
+            for d in range(self.mask):
+                R = c.add_mixed(R, Baff)
+                points.append(R)
+            # 2^w * B
+            for j in range(self.window):
+                B = c.double_jacobian(B)
+
+        points = c.to_affine_batch(points)
+        n = self.mask
+        return [[None] + points[i * n:(i + 1) * n] for i in range(rows)]
+
+    def mul_jacobian(self, k):
+        c = self.curve
+        k = int(k) % c.n
+        R = INF
+        for row in self.table:
+            if not k:
+                break
+            d = k & self.mask
+            if d:
+                R = c.add_mixed(R, row[d])
+            k >>= self.window
+        return R
+
+    def mul(self, k):
+        return self.curve.to_affine(self.mul_jacobian(k))
+
+    def to_bytes(self):
+        size = self.curve.size
+        data = [bytes([self.window])]
+        for row in self.table:
+            for x, y in row[1:]:
+                data.append(x.to_bytes(size, 'big') + y.to_bytes(size, 'big'))
+        return b''.join(data)
+
+    @classmethod
+    def from_bytes(cls, curve, data, P=None):
+        size = curve.size
+        window = data[0]
+        data = memoryview(data)[1:]
+        n = (1 << window) - 1
+        rows = (curve.n.bit_length() + window - 1) // window
+        table = []
+        for i in range(rows):
+            row = [None]
+            for j in range(n):
+                start = (i * n + j) * 2 * size
+                x = int.from_bytes(data[start:start + size], 'big')
+                y = int.from_bytes(data[start + size:start + 2 * size], 'big')
+                row.append((x, y))
+            table.append(row)
+        return cls(curve, P or table[0][1], window=window, table=table)
+
+
+CURVES = {
+    # NIST P-256 / secp256r1
+    'P-256': dict(
+        p=0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff,
+        a=-3,
+        b=0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b,
+        n=0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551,
+        gx=0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+        gy=0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5,
+    ),
+}
+
+
+def get_curve(name, backend=None):
+    return Curve(name, backend=backend, **CURVES[name])
+
+
+def curve_by_p(p):
+    '''
+    Returns the curve name with the prime p, or None
+    '''
+
+    for name, params in CURVES.items():
+        if params['p'] == int(p):
+            return name
+    return None
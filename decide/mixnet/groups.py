@@ -0,0 +1,129 @@
+'''
+Catalogue of ElGamal group parameters.
+
+Each group is (p, g) with p a safe prime, p = 2q + 1 with q prime, and g a
+generator of the order q subgroup, like the ones ElGamal.generate returns.
+Looking for a safe prime is slow with big keys, so the mixnet uses these
+parameters to generate new keys. The groups are the published ones of
+RFC 7919, and more parameters can be generated offline with the
+mixnet_genparams command.
+
+>>> all(check_group(p, g) for p, g in GROUPS.values())
+True
+>>> all(check_group(p, g) for p, g in TEST_GROUPS.values())
+True
+>>> check_group(23, 2), check_group(21, 4), check_group(23, 5)
+(True, False, False)
+'''
+
+from Crypto.Util.number import isPrime
+
+
+# RFC 7919, appendix A, the ffdhe2048, ffdhe3072 and ffdhe4096 groups:
+# p = 2^b - 2^(b-64) + (floor(2^(b-130) * e) + X) * 2^64 - 1, a safe prime
+# for the smallest X, and g = 2, that generates the order q subgroup
+GROUPS = {
+    2048: (
+        int(
+            'ffffffffffffffffadf85458a2bb4a9aafdc5620273d3cf1d8b9c583ce2d3695'
+            'a9e13641146433fbcc939dce249b3ef97d2fe363630c75d8f681b202aec4617a'
+            'd3df1ed5d5fd65612433f51f5f066ed0856365553ded1af3b557135e7f57c935'
+            '984f0c70e0e68b77e2a689daf3efe8721df158a136ade73530acca4f483a797a'
+            'bc0ab182b324fb61d108a94bb2c8e3fbb96adab760d7f4681d4f42a3de394df4'
+            'ae56ede76372bb190b07a7c8ee0a6d709e02fce1cdf7e2ecc03404cd28342f61'
+            '9172fe9ce98583ff8e4f1232eef28183c3fe3b1b4c6fad733bb5fcbc2ec22005'
+            'c58ef1837d1683b2c6f34a26c1b2effa886b423861285c97ffffffffffffffff', 16),
+        2,
+    ),
+    3072: (
+        int(
+            'ffffffffffffffffadf85458a2bb4a9aafdc5620273d3cf1d8b9c583ce2d3695'
+            'a9e13641146433fbcc939dce249b3ef97d2fe363630c75d8f681b202aec4617a'
+            'd3df1ed5d5fd65612433f51f5f066ed0856365553ded1af3b557135e7f57c935'
+            '984f0c70e0e68b77e2a689daf3efe8721df158a136ade73530acca4f483a797a'
+            'bc0ab182b324fb61d108a94bb2c8e3fbb96adab760d7f4681d4f42a3de394df4'
+            'ae56ede76372bb190b07a7c8ee0a6d709e02fce1cdf7e2ecc03404cd28342f61'
+            '9172fe9ce98583ff8e4f1232eef28183c3fe3b1b4c6fad733bb5fcbc2ec22005'
+            'c58ef1837d1683b2c6f34a26c1b2effa886b4238611fcfdcde355b3b6519035b'
+            'bc34f4def99c023861b46fc9d6e6c9077ad91d2691f7f7ee598cb0fac186d91c'
+            'aefe130985139270b4130c93bc437944f4fd4452e2d74dd364f2e21e71f54bff'
+            '5cae82ab9c9df69ee86d2bc522363a0dabc521979b0deada1dbf9a42d5c4484e'
+            '0abcd06bfa53ddef3c1b20ee3fd59d7c25e41d2b66c62e37ffffffffffffffff', 16),
+        2,
+    ),
+    4096: (
+        int(
+            'ffffffffffffffffadf85458a2bb4a9aafdc5620273d3cf1d8b9c583ce2d3695'
+            'a9e13641146433fbcc939dce249b3ef97d2fe363630c75d8f681b202aec4617a'
+            'd3df1ed5d5fd65612433f51f5f066ed0856365553ded1af3b557135e7f57c935'
+            '984f0c70e0e68b77e2a689daf3efe8721df158a136ade73530acca4f483a797a'
+            'bc0ab182b324fb61d108a94bb2c8e3fbb96adab760d7f4681d4f42a3de394df4'
+            'ae56ede76372bb190b07a7c8ee0a6d709e02fce1cdf7e2ecc03404cd28342f61'
+            '9172fe9ce98583ff8e4f1232eef28183c3fe3b1b4c6fad733bb5fcbc2ec22005'
+            'c58ef1837d1683b2c6f34a26c1b2effa886b4238611fcfdcde355b3b6519035b'
+            'bc34f4def99c023861b46fc9d6e6c9077ad91d2691f7f7ee598cb0fac186d91c'
+            'aefe130985139270b4130c93bc437944f4fd4452e2d74dd364f2e21e71f54bff'
+            '5cae82ab9c9df69ee86d2bc522363a0dabc521979b0deada1dbf9a42d5c4484e'
+            '0abcd06bfa53ddef3c1b20ee3fd59d7c25e41d2b669e1ef16e6f52c3164df4fb'
+            '7930e9e4e58857b6ac7d5f42d69f6d187763cf1d5503400487f55ba57e31cc7a'
+            '7135c886efb4318aed6a1e012d9e6832a907600a918130c46dc778f971ad0038'
+            '092999a333cb8b7a1a1db93d7140003c2a4ecea9f98d0acc0a8291cdcec97dcf'
+            '8ec9b55a7f88a46b4db5a851f44182e1c68a007e5e655f6affffffffffffffff', 16),
+        2,
+    ),
+}
+
+# small groups, too weak for a real voting, that are only used with
+# MIXNET_TEST_GROUPS, in the tests and in development
+TEST_GROUPS = {
+    256: (
+        int(
+            'ae0f0361893471d44ec3ed32287a428196a996538c5893dfce2f4e2c39fd50f3', 16),
+        int(
+            '3df082a4bbdb5d52118643ecd18d6fa9756c4bfc705bdab922a73de9f6a7136a', 16),
+    ),
+    512: (
+        int(
+            'a1aa13b6faed8f5817170efa1cdbdc86b9ffdde374e59c9043fec9a18573abc1'
+            'ef15beb4f5c4eabbf5f9a6aa6cb3fa96d18b2804f5f47e25491aa337843f2493', 16),
+        int(
+            '27bcc8cc9abad71ac38f7dd91b4c184fad19012411cd5b99c951e09bff65a4cb'
+            '07e01445b9cb216bc67dd4eb55d3b68d14df88fcc9bbd5c24b6bdb8e5281a5c5', 16),
+    ),
+    1024: (
+        int(
+            '84d79862589dcaecdb75ddf634a2fbc240d08acc6b9fca9937a37091273f2bdf'
+            'fb4bc1be2d2fb5d26faea94453fd446213933e22a426c0756f23868ff342ab3b'
+            'cf04144dd868e41f6b61552e220204cb8a2c8d2de8aeb32c883b59900dc7ad5f'
+            '46ba9b750bf995e958f93e58ba22b94c750e54ab8216fe2949653dfa9ec84b07', 16),
+        int(
+            '32743d856983f64b5b88df99f1d6c6a3f8c73076efb3c4e28c9c7266c06496df'
+            'de7b28e32ec6a15670d739b1a62b0f257ca9c7b027e0c1612d07cea038b2b80d'
+            '29beafb403c5a1ca397dd9106442f9228424a5df05708cbdba09b5189945a5f3'
+            '2b8e19b8100f74685a7aa4ee02926e076b1e36788b4d00153147ae247f8e1608', 16),
+    ),
+}
+
+
+def check_group(p, g):
+    '''
+    Checks that p is a safe prime and g a generator of the order q subgroup
+    '''
+
+    p, g = int(p), int(g)
+    q = (p - 1) // 2
+    if p < 7 or not isPrime(p) or not isPrime(q):
+        return False
+    return 1 < g < p - 1 and pow(g, q, p) == 1
+
+
+def get_group(bits, test=False):
+    '''
+    Returns the (p, g) group of bits size from the catalogue or None, and
+    with test from the TEST_GROUPS too
+
+    >>> get_group(256), get_group(256, test=True) == TEST_GROUPS[256]
+    (None, True)
+    '''
+
+    return GROUPS.get(bits) or (TEST_GROUPS.get(bits) if test else None)
@@ -0,0 +1,56 @@
+'''
+Per process LRU cache of the key contexts, the MixCrypt of each key with
+its validated key objects and fixed-base tables, so they're built only
+once and not in each request, see mixnet.models.get_crypt.
+
+>>> c = KeyCache(size=2)
+>>> c.get('a', lambda: 1), c.get('b', lambda: 2), c.get('a', lambda: 3)
+(1, 2, 1)
+>>> c.get('c', lambda: 4), c.get('b', lambda: 5), c.get('a', lambda: 6)
+(4, 5, 6)
+>>> c.discard('a'), len(c)
+(None, 1)
+'''
+
+import threading
+from collections import OrderedDict
+
+
+class KeyCache:
+    def __init__(self, size=32):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, build):
+        '''
+        Returns the value for the key, calling build to get it if it's not
+        in the cache. With size 0 nothing is cached.
+        '''
+
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+
+        value = build()
+        if not self.size:
+            return value
+
+        with self.lock:
+            value = self.items.setdefault(key, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return value
+
+    def discard(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mixnet.groups import check_group
+from mixnet.mixcrypt import MixCrypt
+from mixnet.models import GroupParams, KeyPool
+
+
+class Command(BaseCommand):
+    help = 'Generate ElGamal group parameters offline, and optionally fill the key pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bits', type=int, default=settings.KEYBITS,
+                            help='Group size in bits')
+        parser.add_argument('--count', type=int, default=1,
+                            help='Number of groups to generate')
+        parser.add_argument('--keys', type=int, default=0,
+                            help='Fill the key pool up to this number of keys')
+
+    def handle(self, *args, **options):
+        bits = options['bits']
+        for i in range(options['count']):
+            print("Generating group {} of {} bits".format(i + 1, bits))
+            k = MixCrypt(bits=bits).k
+            p, g = int(k.p), int(k.g)
+            if not check_group(p, g):
+                print(" * Invalid group, skipped")
+                continue
+            GroupParams(bits=bits, p=p, g=g).save()
+
+        if options['keys']:
+            print("Filling the key pool")
+            KeyPool.fill(bits, options['keys'])
@@ -0,0 +1,26 @@
+# Generated by Django 2.0 on 2026-10-18 11:00
+
+import base.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_key_precomp'),
+        ('mixnet', '0004_auto_20180605_0842'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReencryptFactor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('a', base.models.BigBigField()),
+                ('b', base.models.BigBigField()),
+                ('key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='factors', to='base.Key')),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='factors', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.0 on 2026-10-18 13:00
+
+import base.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_key_precomp'),
+        ('mixnet', '0005_reencryptfactor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupParams',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bits', models.PositiveIntegerField()),
+                ('p', base.models.BigBigField()),
+                ('g', base.models.BigBigField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='KeyPool',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bits', models.PositiveIntegerField()),
+                ('key', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pool', to='base.Key')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.0 on 2026-10-18 18:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0006_groupparams_keypool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(max_length=64)),
+                ('index', models.PositiveIntegerField()),
+                ('msgs', models.BinaryField()),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 19:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0007_mixchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.CharField(max_length=64)),
+                ('path', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('relayed', 'Relayed to the next auth'), ('done', 'Done'), ('error', 'Error')], default='running', max_length=20)),
+                ('result', models.BinaryField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
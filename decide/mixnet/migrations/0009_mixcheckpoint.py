@@ -0,0 +1,26 @@
+# Generated by Django 2.0 on 2026-10-18 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0008_mixjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=200)),
+                ('key', models.CharField(db_index=True, max_length=100)),
+                ('msgs', models.BinaryField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
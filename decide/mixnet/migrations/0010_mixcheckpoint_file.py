@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0009_mixcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mixcheckpoint',
+            name='file',
+            field=models.CharField(blank=True, default='', max_length=400),
+        ),
+    ]
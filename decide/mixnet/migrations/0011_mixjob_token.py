@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0010_mixcheckpoint_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mixjob',
+            name='token',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
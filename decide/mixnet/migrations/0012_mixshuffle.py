@@ -0,0 +1,22 @@
+# Generated by Django 2.0 on 2026-10-18 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0011_mixjob_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MixShuffle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('mixnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shuffles', to='mixnet.Mixnet')),
+            ],
+        ),
+    ]
@@ -34,36 +34,242 @@ True
 '''
 
 
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
 from pprint import pprint
+import os
+import pickle
+import struct
+import threading
+import uuid
 
 from Crypto.PublicKey import ElGamal
 from Crypto.Random import random
 from Crypto import Random
-from Crypto.Util.number import GCD
 
+try:
+    from .arith import get_backend, batch_invert
+    from .batch import CiphertextBatch
+    from .ecgroup import ECFixedBase, INF, get_curve
+except ImportError:
+    from arith import get_backend, batch_invert
+    from batch import CiphertextBatch
+    from ecgroup import ECFixedBase, INF, get_curve
 
-def rand(p):
+
+# bits of the exponent processed by each row of the fixed-base tables
+WINDOW = 5
+
+# bytes read from the OS random generator each time the pool is empty
+RANDOM_BLOCK = 64 * 1024
+
+# number of ciphertexts processed at once when a permutation is applied
+CHUNK = 1024
+
+# clear msg of an EC ElGamal plaintext that isn't an encoded msg, an invalid
+# vote, see ECMixCrypt.decode
+INVALID_MSG = -1
+
+
+class RandomPool:
+    '''
+    Random numbers from the OS CSPRNG. The random bytes are read in big
+    blocks and served from a buffer, to avoid a syscall for each number.
+
+    The buffer is discarded in a forked process, so two processes never
+    use the same random bytes.
+
+    >>> r = RandomPool(block=16)
+    >>> all(0 <= r.randbelow(10) < 10 for i in range(100))
+    True
+    >>> sorted(set(r.randint(1, 3) for i in range(100)))
+    [1, 2, 3]
+    >>> len(r.randints(0, 5, 7))
+    7
+    '''
+
+    def __init__(self, block=RANDOM_BLOCK):
+        self.block = block
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.buf = b''
+        self.pos = 0
+
+    def read(self, n):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.buf, self.pos = b'', 0
+
+            if self.pos + n > len(self.buf):
+                rest = self.buf[self.pos:]
+                self.buf = rest + os.urandom(max(self.block, n))
+                self.pos = 0
+
+            data = self.buf[self.pos:self.pos + n]
+            self.pos += n
+            return data
+
+    def randbelow(self, n):
+        '''
+        Random int in [0, n)
+        '''
+
+        n = int(n)
+        bits = (n - 1).bit_length()
+        size = (bits + 7) // 8
+        while True:
+            r = int.from_bytes(self.read(size), 'big') >> (size * 8 - bits)
+            if r < n:
+                return r
+
+    def randint(self, a, b):
+        '''
+        Random int in [a, b]
+        '''
+
+        return a + self.randbelow(b - a + 1)
+
+    def randints(self, a, b, n):
+        return [self.randint(a, b) for i in range(n)]
+
+
+# random pool used by default in this module
+randpool = RandomPool()
+
+
+def exp_bound(p, bits=0):
+    '''
+    Upper bound of the exponents for the safe prime p, the order q = (p-1)/2
+    of the subgroup generated by g, or 2^bits for short exponents if bits
+    is set and it's smaller
+
+    >>> exp_bound(167), exp_bound(167, 4), exp_bound(167, 10)
+    (83, 16, 83)
+    '''
+
+    q = (int(p) - 1) // 2
+    if bits and bits < q.bit_length():
+        return 1 << bits
+    return q
+
+
+def rand(p, bits=0):
+    return rands(p, 1, bits)[0]
+
+
+def rands(p, n, bits=0):
+    '''
+    Returns n random exponents for the safe prime p, in [1, q-1], or short
+    exponents with bits bits, see exp_bound
+    '''
+
+    return randpool.randints(1, exp_bound(p, bits) - 1, n)
+
+
+def gen_perm(n, pool=None):
+    '''
+    Random permutation of range(n), with the inside-out Fisher-Yates
+    shuffle, in O(n)
+
+    >>> sorted(gen_perm(10)) == list(range(10))
+    True
+    >>> gen_perm(0), gen_perm(1)
+    ([], [0])
+    '''
+
+    pool = pool or randpool
+    x = list(range(n))
+    for i in range(n):
+        d = pool.randbelow(i + 1)
+        if i != d:
+            x[i] = x[d]
+            x[d] = i
+    return x
+
+
+def msgs_on_disk(msgs):
+    '''
+    True for the batches on disk, where the random reads are slow, see
+    batch.DiskBatch
+    '''
+
+    return getattr(msgs, 'on_disk', False)
+
+
+def apply_perm(msgs, perm):
+    '''
+    Iterates over msgs in the perm order without copying msgs, that can be
+    any sequence with random access, a list or an on-disk sequence
+    '''
+
+    for p in perm:
+        yield msgs[p]
+
+
+def perm_chunks(msgs, perm, size=CHUNK):
+    '''
+    Iterates over msgs in the perm order, in lists of size elements
+
+    >>> list(perm_chunks('abcde', [4, 3, 2, 1, 0], 2))
+    [['e', 'd'], ['c', 'b'], ['a']]
+    '''
+
+    it = apply_perm(msgs, perm)
     while True:
-        k = random.StrongRandom().randint(1, int(p) - 1)
-        if GCD(k, int(p) - 1) == 1: break
-    return k
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def dlog(h, g, p, bound, backend=None):
+    '''
+    Discrete logarithm of h in base g for small values, in [0, bound], with
+    the baby-step giant-step algorithm. It's used to decode the exponential
+    ElGamal plaintexts g^m.
+
+    >>> dlog(pow(5, 37, 1019), 5, 1019, 100)
+    37
+    >>> dlog(1, 5, 1019, 100)
+    0
+    '''
+
+    b = backend or get_backend()
+    h, g, p = int(h), int(g), int(p)
+    m = int(bound ** 0.5) + 1
+
+    baby = {}
+    e = b.mpz(1)
+    for j in range(m):
+        baby.setdefault(int(e), j)
+        e = (e * g) % p
+
+    # g^-m
+    factor = b.invert(b.powmod(g, m, p), p)
+    gamma = b.mpz(h)
+    for i in range(m + 1):
+        j = baby.get(int(gamma))
+        if j is not None and i * m + j <= bound:
+            return i * m + j
+        gamma = (gamma * factor) % p
+
+    raise ValueError('discrete logarithm not found in [0, {}]'.format(bound))
 
 
 def gen_multiple_key(*crypts):
     k1 = crypts[0]
-    k = MixCrypt(k=k1.k, bits=k1.bits)
-    k.k.y = 1
-    for kx in crypts:
-        k.k.y *= kx.k.y
-    k.k.y = k.k.y % k.k.p
-    return k
+    p, g, y = k1.pubkey()
+    for kx in crypts[1:]:
+        y = k1.mul(y, kx.k.y)
+    return k1.__class__(key=(p, g, y), **k1.init_kwargs())
 
 
 def multiple_decrypt(c, *crypts):
     a, b = c
     for k in crypts:
         b = k.decrypt((a, b))
-    return b
+    return crypts[-1].decode(b)
 
 
 def multiple_decrypt_shuffle(ciphers, *crypts):
@@ -90,7 +296,7 @@ def multiple_decrypt_shuffle2(ciphers, *crypts, pubkey=None):
     True
     '''
 
-    b = ciphers.copy()
+    b = ciphers
 
     # shuffle
     for k in crypts:
@@ -103,67 +309,467 @@ def multiple_decrypt_shuffle2(ciphers, *crypts, pubkey=None):
     return b
 
 
+# (id, MixCrypt) used by a pool worker process, see pool_map
+_worker_crypt = (None, None)
+
+
+def _get_worker_crypt(state):
+    '''
+    MixCrypt of the state (id, pickled class, key, kwargs and tables), it's
+    built the first time the worker needs it and reused for the next chunks
+    '''
+
+    global _worker_crypt
+    state_id, data = state
+    if _worker_crypt[0] != state_id:
+        cls, key, kwargs, tables = pickle.loads(data)
+        crypt = cls(key=key, **kwargs)
+        for pk, table in tables.items():
+            crypt.precompute(pk, data=table)
+        _worker_crypt = (state_id, crypt)
+    return _worker_crypt[1]
+
+
+def _run_chunk(method, chunk, args, state):
+    return getattr(_get_worker_crypt(state), method)(chunk, *args)
+
+
+def pool_map(crypt, method, msgs, workers, *args, perm=None):
+    '''
+    Calls the crypt batch method (multiple_reencrypt, multiple_decrypt)
+    splitting msgs in chunks that are processed by a pool of workers
+    processes. The result keeps the msgs order, or the perm order if perm
+    is passed.
+
+    >>> B = 256
+    >>> k = MixCrypt(bits=B)
+    >>> clears = [random.StrongRandom().randint(1, B) for i in range(10)]
+    >>> cipher = [k.encrypt(i) for i in clears]
+    >>> pool_map(k, 'multiple_decrypt', cipher, 3, True) == clears
+    True
+    '''
+
+    if perm is None:
+        perm = range(len(msgs))
+    if not perm:
+        return []
+
+    k = crypt.k
+    key = (k.p, k.g, k.y, k.x) if k.has_private() else (k.p, k.g, k.y)
+    key = tuple(map(int, key))
+    tables = {pk: crypt.dump_tables(pk) for pk in crypt.tables}
+
+    size = -(-len(perm) // (workers * 4))
+    chunks = perm_chunks(msgs, perm, size)
+    # sent with each chunk, there's no pool initializer in python 3.6, and
+    # pickled once so it's only copied
+    state = (uuid.uuid4().hex,
+             pickle.dumps((crypt.__class__, key, crypt.init_kwargs(), tables)))
+    with ProcessPoolExecutor(workers) as pool:
+        results = pool.map(_run_chunk, repeat(method), chunks, repeat(args),
+                           repeat(state))
+        msgs2 = crypt.new_batch(msgs)
+        for r in results:
+            msgs2.extend(r)
+    return msgs2
+
+
+class FixedBase:
+    '''
+    Precomputed table to exponentiate always the same base.
+
+    The table stores base^(d * 2^(w*i)) mod p for every w bits window i of
+    the exponent and every digit d, so base^e mod p is just a modular
+    multiplication per window, without squarings.
+
+    >>> fb = FixedBase(2, 1019, window=3)
+    >>> all(fb.pow(e) == pow(2, e, 1019) for e in range(0, 1019))
+    True
+    >>> fb2 = FixedBase.from_bytes(fb.to_bytes(), 2, 1019)
+    >>> fb2.pow(555) == pow(2, 555, 1019)
+    True
+    '''
+
+    def __init__(self, base, p, window=WINDOW, table=None, backend=None,
+                 bits=None):
+        '''
+        bits is the size of the biggest exponent, p bits by default, the
+        bigger ones are computed without the table
+        '''
+
+        self.backend = backend or get_backend()
+        self.base = self.backend.mpz(int(base))
+        self.p = self.backend.mpz(int(p))
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.bits = bits or int(p).bit_length()
+        self.table = table or self.build()
+
+    def build(self):
+        p = self.p
+        b = self.base % p
+        one = self.backend.mpz(1)
+        rows = (self.bits + self.window - 1) // self.window
+        table = []
+        for i in range(rows):
+            row = [one]
+            for d in range(self.mask):
+                row.append((row[-1] * b) % p)
+            table.append(row)
+            # b^(2^w) is the base for the next window
+            b = (row[-1] * b) % p
+        return table
+
+    def pow(self, e):
+        e = int(e)
+        if e < 0 or e.bit_length() > len(self.table) * self.window:
+            return self.backend.powmod(self.base, e, self.p)
+
+        p, mask = self.p, self.mask
+        r = self.backend.mpz(1)
+        for row in self.table:
+            if not e:
+                break
+            d = e & mask
+            if d:
+                r = (r * row[d]) % p
+            e >>= self.window
+        return r
+
+    def to_bytes(self):
+        size = (int(self.p).bit_length() + 7) // 8
+        data = [struct.pack('>BI', self.window, len(self.table))]
+        for row in self.table:
+            for v in row[1:]:
+                data.append(int(v).to_bytes(size, 'big'))
+        return b''.join(data)
+
+    @classmethod
+    def from_bytes(cls, data, base, p, backend=None):
+        mpz = (backend or get_backend()).mpz
+        p = int(p)
+        size = (p.bit_length() + 7) // 8
+        window, rows = struct.unpack_from('>BI', data)
+        data = memoryview(data)[struct.calcsize('>BI'):]
+        n = (1 << window) - 1
+        table = []
+        for i in range(rows):
+            row = [mpz(1)]
+            for j in range(n):
+                start = (i * n + j) * size
+                v = int.from_bytes(data[start:start + size], 'big')
+                row.append(mpz(v))
+            table.append(row)
+        return cls(base, p, window=window, table=table, backend=backend)
+
+
 class MixCrypt:
-    def __init__(self, k=None, bits=256):
+    def __init__(self, k=None, bits=256, key=None, backend=None, exp_bits=0):
+        '''
+        k is a key to get p and g from and generate a new private key,
+        key is a (p, g, y, x) or (p, g, y) tuple to use as is. Without any
+        of them a new key is generated.
+
+        backend is the name of the arithmetic backend, see arith.
+
+        exp_bits is the size of the private key and the random exponents,
+        0 to draw them from the whole subgroup, see exp_bound.
+        '''
+
         self.bits = bits
-        if k:
+        self.exp_bits = exp_bits
+        self.backend = get_backend(backend)
+        # fixed-base tables for (g, y) indexed by (p, g, y)
+        self.tables = {}
+        # public key objects indexed by (p, g, y), see get_key
+        self.keys = {}
+        if key:
+            self.k = self.construct(key)
+        elif k:
             self.k = self.getk(k.p, k.g)
         else:
             self.k = self.genk()
 
+    def init_kwargs(self):
+        '''
+        Keyword arguments to build a MixCrypt like this one with other key
+        '''
+
+        return dict(bits=self.bits, backend=self.backend.name,
+                    exp_bits=self.exp_bits)
+
+    def construct(self, key):
+        return ElGamal.construct(tuple(map(int, key)))
+
+    def width(self):
+        '''
+        Bytes of each group element, for the CiphertextBatch
+        '''
+
+        return (int(self.k.p).bit_length() + 7) // 8
+
+    def new_batch(self, msgs):
+        '''
+        Empty container for the result of a batch method with msgs, a
+        CiphertextBatch if msgs is one, so the batch methods accept both
+        lists and batches, and return the same type
+
+        >>> k = MixCrypt(bits=256)
+        >>> msgs = CiphertextBatch.from_list([k.encrypt(i) for i in (2, 3)])
+        >>> clears = k.multiple_decrypt(k.shuffle(msgs))
+        >>> type(clears).__name__, sorted(clears)
+        ('CiphertextBatch', [2, 3])
+        '''
+
+        if isinstance(msgs, CiphertextBatch):
+            return msgs.new(self.width())
+        return []
+
+    def get_key(self, pubkey=None):
+        '''
+        Key object for the pubkey tuple, or the own key, that is validated
+        by construct only the first time
+        '''
+
+        if not pubkey:
+            return self.k
+        pubkey = self.pubkey(pubkey)
+        k = self.keys.get(pubkey)
+        if k is None:
+            k = self.keys[pubkey] = self.construct(pubkey)
+        return k
+
     def genk(self):
         self.k = ElGamal.generate(self.bits, Random.new().read)
         return self.k
 
     def getk(self, p, g):
-        x = rand(p)
-        y = pow(g, x, p)
+        p, g = int(p), int(g)
+        x = rand(p, self.exp_bits)
+        y = int(self.backend.powmod(g, x, p))
         self.k = ElGamal.construct((p, g, y, x))
         return self.k
 
     def setk(self, p, g, y, x):
-        self.k = ElGamal.construct((p, g, y, x))
+        self.k = self.construct((p, g, y, x))
         return self.k
 
-    def encrypt(self, m, k=None):
-        r = rand(self.k.p)
+    def precompute(self, pubkey=None, data=None):
+        '''
+        Builds the fixed-base tables for g and y of the pubkey, or the own
+        key if there's no pubkey. These tables are used by encrypt and
+        reencrypt with this key.
+
+        data is the result of a previous dump_tables call, to load the
+        tables instead of building them again.
+
+        >>> k = MixCrypt(bits=256)
+        >>> tg, ty = k.precompute()
+        >>> k2 = MixCrypt(bits=256)
+        >>> k2.k = k.k
+        >>> k2.precompute(data=k.dump_tables())[1].table == ty.table
+        True
+        >>> clears = [random.StrongRandom().randint(1, 256) for i in range(5)]
+        >>> cipher = [k.encrypt(i) for i in clears]
+        >>> cipher2 = [k.reencrypt(i) for i in cipher]
+        >>> clears == [k.decrypt(i) for i in cipher2]
+        True
+
+        With short exponents the tables are smaller:
+
+        >>> k3 = MixCrypt(k=k.k, bits=256, exp_bits=64)
+        >>> k3.k.x < 2 ** 64, len(k3.precompute()[0].table) < len(tg.table)
+        (True, True)
+        >>> cipher3 = [k3.reencrypt(k3.encrypt(i)) for i in clears]
+        >>> clears == [k3.decrypt(i) for i in cipher3]
+        True
+        '''
+
+        p, g, y = self.pubkey(pubkey)
+        b = self.backend
+        if data:
+            size = len(data) // 2
+            tables = (FixedBase.from_bytes(data[:size], g, p, backend=b),
+                      FixedBase.from_bytes(data[size:], y, p, backend=b))
+        else:
+            bits = exp_bound(p, self.exp_bits).bit_length()
+            tables = (FixedBase(g, p, backend=b, bits=bits),
+                      FixedBase(y, p, backend=b, bits=bits))
+        self.tables[(p, g, y)] = tables
+        return tables
+
+    def dump_tables(self, pubkey=None):
+        '''
+        Returns the fixed-base tables of the pubkey as bytes, building them
+        if needed.
+        '''
+
+        p, g, y = self.pubkey(pubkey)
+        tables = self.tables.get((p, g, y)) or self.precompute((p, g, y))
+        return b''.join(t.to_bytes() for t in tables)
+
+    def pubkey(self, pubkey=None):
+        if not pubkey:
+            k = self.k
+            pubkey = k.p, k.g, k.y
+        return tuple(map(int, pubkey))
+
+    def encrypt(self, m, k=None, r=None):
         if not k:
             k = self.k
-        a, b = k._encrypt(m, r)
-        return a, b
+        p, g, y = self.pubkey((k.p, k.g, k.y))
+        if not r:
+            r = rand(p, self.exp_bits)
+        tables = self.tables.get((p, g, y))
+        if tables:
+            tg, ty = tables
+            a, s = tg.pow(r), ty.pow(r)
+        else:
+            powmod = self.backend.powmod
+            a, s = powmod(g, r, p), powmod(y, r, p)
+        return int(a), int((s * int(m)) % p)
+
+    def mul(self, a, b):
+        '''
+        Group operation with two elements, used to combine the public keys
+        and the ciphertexts
+        '''
+
+        return int((self.backend.mpz(int(a)) * int(b)) % int(self.k.p))
+
+    def div(self, a, b):
+        '''
+        Inverse of mul, a * b^-1, used to remove a public key share
+        '''
+
+        p = int(self.k.p)
+        return int((self.backend.mpz(int(a)) * self.backend.invert(int(b), p)) % p)
+
+    def decode(self, m):
+        '''
+        Plaintext of a decrypted group element
+        '''
 
-    def decrypt(self, c):
-        m = self.k._decrypt(c)
         return m
 
+    def dlog(self, m, bound):
+        '''
+        Exponent of the decrypted exponential ElGamal element m, see dlog
+        '''
+
+        k = self.k
+        return dlog(m, k.g, k.p, bound, self.backend)
+
+    def encrypt_exp(self, m, k=None):
+        '''
+        Exponential ElGamal, encrypts g^m. The product of these ciphertexts
+        is the encryption of g^(sum of m), used for the homomorphic tally.
+
+        >>> k = MixCrypt(bits=256)
+        >>> c1, c2 = k.encrypt_exp(1), k.encrypt_exp(2)
+        >>> p = int(k.k.p)
+        >>> m = k.decrypt(((c1[0] * c2[0]) % p, (c1[1] * c2[1]) % p))
+        >>> dlog(m, k.k.g, p, 10)
+        3
+        '''
+
+        if not k:
+            k = self.k
+        p, g, y = self.pubkey((k.p, k.g, k.y))
+        return self.encrypt(self.backend.powmod(g, int(m), p), k=k)
+
+    def decrypt(self, c):
+        b = self.backend
+        p, x = int(self.k.p), int(self.k.x)
+        a, m = (b.mpz(int(i)) for i in c)
+        s = b.powmod(a, x, p)
+        return int((m * b.invert(s, p)) % p)
+
+    def batch_decrypt(self, msgs):
+        '''
+        Decrypts all the msgs, with a single modular inversion for all of
+        them, see arith.batch_invert
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> clears = [random.StrongRandom().randint(1, B) for i in range(5)]
+        >>> k.batch_decrypt([k.encrypt(i) for i in clears]) == clears
+        True
+        '''
+
+        b = self.backend
+        p, x = int(self.k.p), int(self.k.x)
+        msgs = [(b.mpz(int(a)), b.mpz(int(m))) for a, m in msgs]
+        invs = batch_invert([b.powmod(a, x, p) for a, m in msgs], p, b)
+        return [int((m * inv) % p) for (a, m), inv in zip(msgs, invs)]
+
+    def partial_decrypt(self, msgs):
+        '''
+        Decryption shares a^x of the msgs with this auth key, that don't
+        depend on the other auths, see combine_shares
+        '''
+
+        b = self.backend
+        p, x = int(self.k.p), int(self.k.x)
+        return [int(b.powmod(b.mpz(int(a)), x, p)) for a, m in msgs]
+
+    def combine_shares(self, msgs, shares):
+        '''
+        Decrypts the msgs with the decryption shares of all the auths, a
+        list of shares for each auth. Returns the group elements, that
+        should be decoded, with a single inversion for all of them.
+
+        >>> k1 = MixCrypt(bits=256)
+        >>> k2 = MixCrypt(k=k1.k, bits=256)
+        >>> k = gen_multiple_key(k1, k2)
+        >>> msgs = [k.encrypt(i) for i in (3, 4)]
+        >>> k.combine_shares(msgs, [k1.partial_decrypt(msgs), k2.partial_decrypt(msgs)])
+        [3, 4]
+        '''
+
+        b = self.backend
+        p = int(self.k.p)
+        prods = []
+        for auth_shares in zip(*shares):
+            s = b.mpz(1)
+            for share in auth_shares:
+                s = (s * int(share)) % p
+            prods.append(s)
+        invs = batch_invert(prods, p, b)
+        return [int((int(m) * inv) % p) for (a, m), inv in zip(msgs, invs)]
+
     def multiple_decrypt(self, msgs, last=True):
-        msgs2 = []
-        for a, b in msgs:
-            clear = self.decrypt((a, b))
+        clears = self.batch_decrypt(msgs)
+        msgs2 = self.new_batch(msgs)
+        for (a, b), clear in zip(msgs, clears):
             if last:
-                msg = clear
+                msg = self.decode(clear)
             else:
                 msg = (a, clear)
             msgs2.append(msg)
         return msgs2
 
-    def shuffle_decrypt(self, msgs, last=True):
-        msgs2 = msgs.copy()
-        msgs3 = []
-        while msgs2:
-            n = random.StrongRandom().randint(0, len(msgs2) - 1)
-            a, b = msgs2.pop(n)
-            clear = self.decrypt((a, b))
-            if last:
-                msg = clear
-            else:
-                msg = (a, clear)
-            msgs3.append(msg)
+    def shuffle_decrypt(self, msgs, last=True, workers=0):
+        perm = gen_perm(len(msgs))
+        # the batches on disk are processed in order, and permuted after it
+        order = range(len(msgs)) if msgs_on_disk(msgs) else perm
+        if workers > 1:
+            msgs2 = pool_map(self, 'multiple_decrypt', msgs, workers, last,
+                             perm=order)
+        else:
+            msgs2 = self.new_batch(msgs)
+            for chunk in perm_chunks(msgs, order):
+                msgs2.extend(self.multiple_decrypt(chunk, last))
 
-        return msgs3
+        if order is not perm:
+            return msgs2.permuted(perm)
+        return msgs2
 
-    def reencrypt(self, cipher, pubkey=None):
+    def reencrypt(self, cipher, pubkey=None, factor=None):
         '''
+        Reencrypts the cipher multiplying it by the encryption of 1. This
+        factor can be passed if it was generated before with gen_factors.
+
         >>> B = 256
         >>> k = MixCrypt(bits=B)
         >>> clears = [random.StrongRandom().randint(1, B) for i in range(5)]
@@ -175,44 +781,340 @@ class MixCrypt:
         True
         >>> cipher != cipher2
         True
+        >>> f = k.gen_factors(5)
+        >>> cipher3 = [k.reencrypt(c, factor=f[i]) for i, c in enumerate(cipher)]
+        >>> clears == [k.decrypt(i) for i in cipher3]
+        True
         '''
 
-        if pubkey:
-            p, g, y = pubkey
-            k = ElGamal.construct((p, g, y))
-        else:
-            k = self.k
+        k = self.get_key(pubkey)
 
-        a, b = map(int, cipher)
-        a1, b1 = map(int, self.encrypt(1, k=k))
+        mpz = self.backend.mpz
+        a, b = (mpz(int(i)) for i in cipher)
+        if not factor:
+            factor = self.encrypt(1, k=k)
+        a1, b1 = (mpz(int(i)) for i in factor)
         p = int(k.p)
 
-        return ((a * a1) % p, (b * b1) % p)
+        return (int((a * a1) % p), int((b * b1) % p))
+
+    def multiple_reencrypt(self, msgs, pubkey=None, factors=None):
+        if not factors:
+            factors = self.gen_factors(len(msgs), pubkey)
+        return [self.reencrypt(m, pubkey, f) for m, f in zip(msgs, factors)]
+
+    def gen_factors(self, n, pubkey=None):
+        '''
+        Generates n reencryption factors (g^r, y^r) for the pubkey. These
+        factors don't depend on the ciphertexts, so they can be generated
+        before the shuffle.
+        '''
+
+        k = self.get_key(pubkey)
+        rs = rands(k.p, n, self.exp_bits)
+        return [self.encrypt(1, k=k, r=r) for r in rs]
 
     def gen_perm(self, l):
-        x = list(range(l))
-        for i in range(l):
-            d = random.StrongRandom().randint(0, i)
-            if i != d:
-                x[i] = x[d]
-                x[d] = i
-        return x
+        return gen_perm(l)
 
-    def shuffle(self, msgs, pubkey=None):
+    def shuffle(self, msgs, pubkey=None, workers=0, factors=None):
         '''
         Reencrypt and shuffle
+
+        With workers > 1 the reencryption is done by a pool of processes.
+        factors are precomputed reencryption factors (see gen_factors), that
+        are used for the first ciphertexts, so the reencryption of these
+        is just a multiplication. It can be a function that returns up to n
+        factors, that is called for each chunk of ciphertexts, so they
+        aren't all in memory.
+
+        >>> B = 256
+        >>> k = MixCrypt(bits=B)
+        >>> clears = [random.StrongRandom().randint(1, B) for i in range(10)]
+        >>> cipher = [k.encrypt(i) for i in clears]
+        >>> cipher2 = k.shuffle(cipher, workers=2)
+        >>> d = [k.decrypt(i) for i in cipher2]
+        >>> sorted(clears) == sorted(d)
+        True
+        >>> cipher3 = k.shuffle(cipher, factors=k.gen_factors(4))
+        >>> sorted(clears) == sorted(k.decrypt(i) for i in cipher3)
+        True
+        >>> cipher4 = k.shuffle(cipher, factors=lambda n: k.gen_factors(min(n, 4)))
+        >>> sorted(clears) == sorted(k.decrypt(i) for i in cipher4)
+        True
         '''
 
-        msgs2 = msgs.copy()
-        perm = self.gen_perm(len(msgs))
-        for i, p in enumerate(perm):
-            m = msgs[p]
-            nm = self.reencrypt(m, pubkey)
-            msgs2[i] = nm
+        perm = gen_perm(len(msgs))
+        # the batches on disk are reencrypted in order, with sequential
+        # reads, and permuted after it, see DiskBatch.permuted
+        order = range(len(msgs)) if msgs_on_disk(msgs) else perm
+
+        if not callable(factors):
+            it = iter(factors or [])
+            factors = lambda n: list(islice(it, n))
 
+        # the ciphertexts with factors, a chunk at a time, until there're
+        # no more factors
+        msgs2 = self.new_batch(msgs)
+        n = 0
+        for chunk in perm_chunks(msgs, order):
+            fs = factors(len(chunk))
+            msgs2.extend(self.multiple_reencrypt(chunk[:len(fs)], pubkey, fs))
+            n += len(fs)
+            if len(fs) < len(chunk):
+                break
+
+        rest = order[n:]
+        if workers > 1:
+            msgs2.extend(pool_map(self, 'multiple_reencrypt', msgs, workers,
+                                  pubkey, perm=rest))
+        else:
+            for chunk in perm_chunks(msgs, rest):
+                msgs2.extend(self.multiple_reencrypt(chunk, pubkey))
+
+        if order is not perm:
+            return msgs2.permuted(perm)
         return msgs2
 
 
+class ECKey:
+    '''
+    Elliptic curve ElGamal key with the same attributes than the ElGamal
+    keys, g and y are the compressed encoding of the points
+    '''
+
+    def __init__(self, curve, y, x=None):
+        self.curve = curve
+        self.p = curve.p
+        self.g = curve.encode(curve.G)
+        self.y = int(y)
+        self.x = x
+        self.Y = curve.decode(y)
+
+    def has_private(self):
+        return self.x is not None
+
+
+class ECMixCrypt(MixCrypt):
+    '''
+    ElGamal over an elliptic curve, see ecgroup. The keys and ciphertexts
+    are encoded as ints, so it's used like MixCrypt, but with much smaller
+    numbers and faster operations for the same security.
+
+    >>> k1 = ECMixCrypt()
+    >>> k2 = ECMixCrypt(k=k1.k)
+    >>> k3 = gen_multiple_key(k1, k2)
+    >>> clears = [random.StrongRandom().randint(1, 256) for i in range(6)]
+    >>> cipher = [k3.encrypt(i) for i in clears]
+    >>> d = multiple_decrypt_shuffle(cipher, k1, k2)
+    >>> sorted(clears) == sorted(d)
+    True
+    >>> d = multiple_decrypt_shuffle2(cipher, k1, k2, pubkey=k3.pubkey())
+    >>> sorted(clears) == sorted(d)
+    True
+    >>> multiple_decrypt(k3.encrypt(7), k1, k2)
+    7
+    >>> k1.precompute()[0].mul(3) == k1.curve.mul(3, k1.curve.G)
+    True
+    >>> k1.decode(k1.decrypt(k1.encrypt(9)))
+    9
+    >>> c1, c2 = k1.encrypt_exp(2), k1.encrypt_exp(3)
+    >>> k1.dlog(k1.decrypt((k1.mul(c1[0], c2[0]), k1.mul(c1[1], c2[1]))), 10)
+    5
+    '''
+
+    def __init__(self, k=None, bits=256, key=None, backend=None,
+                 curve='P-256', exp_bits=0):
+        # the exponents are always in [1, n-1], exp_bits is ignored
+        self.curve = get_curve(curve, get_backend(backend))
+        super().__init__(k=k, bits=bits, key=key, backend=backend)
+
+    def init_kwargs(self):
+        kwargs = super().init_kwargs()
+        kwargs['curve'] = self.curve.name
+        return kwargs
+
+    def construct(self, key):
+        key = tuple(map(int, key))
+        if key[0] != self.curve.p or key[1] != self.curve.encode(self.curve.G):
+            raise ValueError('the key is not for the curve ' + self.curve.name)
+        return ECKey(self.curve, *key[2:])
+
+    def genk(self):
+        c = self.curve
+        x = randpool.randint(1, c.n - 1)
+        self.k = ECKey(c, c.encode(c.mul(x, c.G)), x)
+        return self.k
+
+    def getk(self, p, g):
+        # only checks that p and g are the curve ones
+        self.construct((p, g, 0))
+        return self.genk()
+
+    def setk(self, p, g, y, x):
+        self.k = self.construct((p, g, y, x))
+        return self.k
+
+    def precompute(self, pubkey=None, data=None):
+        p, g, y = self.pubkey(pubkey)
+        c = self.curve
+        Y = c.decode(y)
+        if data:
+            size = len(data) // 2
+            tables = (ECFixedBase.from_bytes(c, data[:size], c.G),
+                      ECFixedBase.from_bytes(c, data[size:], Y))
+        else:
+            tables = (ECFixedBase(c, c.G), ECFixedBase(c, Y))
+        self.tables[(p, g, y)] = tables
+        return tables
+
+    def factor_points(self, k, r):
+        '''
+        (rG, rY) in jacobian coordinates, with the fixed-base tables if
+        there're tables for the key k
+        '''
+
+        c = self.curve
+        tables = self.tables.get(self.pubkey((k.p, k.g, k.y)))
+        if tables:
+            tg, ty = tables
+            return tg.mul_jacobian(r), ty.mul_jacobian(r)
+        return c.mul_jacobian(r, c.G), c.mul_jacobian(r, k.Y)
+
+    def encrypt_point(self, M, k=None, r=None):
+        c = self.curve
+        k = k or self.k
+        r = r or randpool.randint(1, c.n - 1)
+        A, S = self.factor_points(k, r)
+        A, B = c.to_affine_batch([A, c.add_mixed(S, M)])
+        return c.encode(A), c.encode(B)
+
+    def encrypt(self, m, k=None, r=None):
+        return self.encrypt_point(self.curve.encode_msg(m), k, r)
+
+    def encrypt_exp(self, m, k=None):
+        c = self.curve
+        return self.encrypt_point(c.mul(int(m), c.G), k)
+
+    def width(self):
+        # the compressed points have a prefix byte
+        return self.curve.size + 1
+
+    def mul(self, a, b):
+        c = self.curve
+        return c.encode(c.add(c.decode(a), c.decode(b)))
+
+    def div(self, a, b):
+        c = self.curve
+        return c.encode(c.add(c.decode(a), c.neg(c.decode(b))))
+
+    def decode(self, m):
+        '''
+        The msg encoded in the point, or INVALID_MSG if it isn't a msg
+        encoded with encode_msg, so a bad vote doesn't stop the tally
+
+        >>> k = ECMixCrypt()
+        >>> k.decode(k.decrypt(k.encrypt(9)))
+        9
+        >>> k.decode(0), k.decode(k.curve.encode(k.curve.G)), k.decode(5)
+        (-1, -1, -1)
+        '''
+
+        c = self.curve
+        try:
+            P = c.decode(m)
+        except ValueError:
+            return INVALID_MSG
+        if P is None:
+            return INVALID_MSG
+        msg = c.decode_msg(P)
+        try:
+            if c.encode_msg(msg)[0] != P[0]:
+                return INVALID_MSG
+        except ValueError:
+            return INVALID_MSG
+        return msg
+
+    def dlog(self, m, bound):
+        return self.curve.dlog(self.curve.decode(m), bound)
+
+    def decrypt(self, c):
+        return self.batch_decrypt([c])[0]
+
+    def batch_decrypt(self, msgs):
+        '''
+        Decrypts the msgs, returns the encoded points B - xA, with a single
+        inversion for all of them
+        '''
+
+        c = self.curve
+        x = int(self.k.x)
+        points = []
+        for a, b in msgs:
+            X, Y, Z = c.mul_jacobian(x, c.decode(a))
+            points.append(c.add_mixed((X, (-Y) % c.p, Z), c.decode(b)))
+        return [c.encode(M) for M in c.to_affine_batch(points)]
+
+    def partial_decrypt(self, msgs):
+        '''
+        Decryption shares xA of the msgs, see MixCrypt.partial_decrypt
+        '''
+
+        c = self.curve
+        x = int(self.k.x)
+        points = [c.mul_jacobian(x, c.decode(a)) for a, b in msgs]
+        return [c.encode(S) for S in c.to_affine_batch(points)]
+
+    def combine_shares(self, msgs, shares):
+        '''
+        B minus the shares of all the auths, the encoded points
+
+        >>> k1 = ECMixCrypt()
+        >>> k2 = ECMixCrypt(k=k1.k)
+        >>> k = gen_multiple_key(k1, k2)
+        >>> msgs = [k.encrypt(i) for i in (3, 4)]
+        >>> clears = k.combine_shares(msgs, [k1.partial_decrypt(msgs), k2.partial_decrypt(msgs)])
+        >>> [k.decode(m) for m in clears]
+        [3, 4]
+        '''
+
+        c = self.curve
+        points = []
+        for (a, b), auth_shares in zip(msgs, zip(*shares)):
+            B = c.decode(b)
+            M = (B[0], B[1], 1) if B else INF
+            for share in auth_shares:
+                M = c.add_mixed(M, c.neg(c.decode(share)))
+            points.append(M)
+        return [c.encode(M) for M in c.to_affine_batch(points)]
+
+    def reencrypt(self, cipher, pubkey=None, factor=None):
+        factors = [factor] if factor else None
+        return self.multiple_reencrypt([cipher], pubkey, factors)[0]
+
+    def multiple_reencrypt(self, msgs, pubkey=None, factors=None):
+        c = self.curve
+        if not factors:
+            factors = self.gen_factors(len(msgs), pubkey)
+        points = []
+        for (a, b), (a1, b1) in zip(msgs, factors):
+            for v, v1 in ((a, a1), (b, b1)):
+                P = c.decode(v)
+                P = (P[0], P[1], 1) if P else INF
+                points.append(c.add_mixed(P, c.decode(v1)))
+        points = [c.encode(P) for P in c.to_affine_batch(points)]
+        return list(zip(points[::2], points[1::2]))
+
+    def gen_factors(self, n, pubkey=None):
+        c = self.curve
+        k = self.get_key(pubkey)
+        points = []
+        for r in randpool.randints(1, c.n - 1, n):
+            points.extend(self.factor_points(k, r))
+        points = [c.encode(P) for P in c.to_affine_batch(points)]
+        return list(zip(points[::2], points[1::2]))
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -1,9 +1,24 @@
-from django.db import models
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
 
-from .mixcrypt import MixCrypt
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .batch import CiphertextBatch, DiskBatch
+from .groups import get_group, check_group
+from .keycache import KeyCache
+from .mixcrypt import MixCrypt, ECMixCrypt, gen_perm, msgs_on_disk, perm_chunks
 
 from base import mods
-from base.models import Auth, Key
+from base.binary import dumps, ints_block, loads, to_json
+from base.models import Auth, Key, BigBigField
 from base.serializers import AuthSerializer
 from django.conf import settings
 
@@ -11,6 +26,112 @@ from django.conf import settings
 # number of bits for the key, all auths should use the same number of bits
 B = settings.KEYBITS
 
+# number of reencryption factors generated and stored at once
+FACTORS_BATCH = 1000
+
+# request data values that change in each try of the same hop, and aren't
+# part of the checkpoint key
+CHECKPOINT_IGNORE = ("stream", "background", "async", "job", "job_token", "origin")
+
+# crypts of the keys used by this process, see get_crypt
+key_contexts = KeyCache(settings.MIXNET_KEY_CACHE)
+
+
+def get_params(bits):
+    '''
+    Returns the (p, g) group parameters of bits size, from the stored
+    GroupParams or from the catalogue, or None if there's no one
+    '''
+
+    params = GroupParams.objects.filter(bits=bits).first()
+    if params:
+        return params.p, params.g
+    return get_group(bits, test=settings.MIXNET_TEST_GROUPS)
+
+
+def make_crypt(key, curve='', exp_bits=0):
+    '''
+    New MixCrypt for the key tuple, an ECMixCrypt if there's curve
+    '''
+
+    if curve:
+        return ECMixCrypt(bits=B, key=key, curve=curve)
+    return MixCrypt(bits=B, key=key, exp_bits=exp_bits)
+
+
+def get_crypt(key, curve='', exp_bits=0):
+    '''
+    MixCrypt for the key tuple, shared by all the requests of the process
+    with the same key, so the key is validated and the fixed-base tables
+    are loaded only once
+    '''
+
+    key = tuple(map(int, key))
+    return key_contexts.get((curve, exp_bits) + key,
+                            lambda: make_crypt(key, curve, exp_bits))
+
+
+def checkpoint_key(path, data):
+    '''
+    Digest of the input of a hop, the path and the request data, to find
+    the checkpoint of a previous try, see Mixnet.checkpoint
+    '''
+
+    rest = {k: v for k, v in data.items()
+            if k not in CHECKPOINT_IGNORE and k != "msgs"}
+    h = hashlib.sha256(path.encode('utf-8'))
+    h.update(json.dumps(rest, sort_keys=True).encode('utf-8'))
+    msgs = data.get("msgs", [])
+    block = ints_block(msgs)
+    if block is None:
+        h.update(dumps(msgs))
+    else:
+        # the ints of a batch on disk are hashed without loading them
+        h.update(repr(block[:3]).encode('utf-8'))
+        h.update(block[3])
+    return h.hexdigest()
+
+
+def msgs_digest(msgs):
+    '''
+    Digest of the msgs, the same for a list or a batch of them
+    '''
+
+    return hashlib.sha256(json.dumps(to_json(msgs)).encode('utf-8')).hexdigest()
+
+
+def new_key(bits, p=0, g=0, curve='', exp_bits=0):
+    '''
+    Generates a new Key. Without p and g the group is taken from
+    get_params, and only if there's no one a new group is generated, that
+    is slow with big keys.
+
+    With curve the key is an elliptic curve key, p and g are ignored.
+
+    exp_bits is the size of the short exponents, that are only used if the
+    group is a safe prime one, see check_group.
+    '''
+
+    if curve:
+        k = ECMixCrypt(bits=bits, curve=curve).k
+        return Key(p=k.p, g=k.g, y=k.y, x=k.x, curve=curve)
+
+    if not p or not g:
+        p, g = get_params(bits) or (0, 0)
+
+    if p and g:
+        if exp_bits and not check_group(p, g):
+            exp_bits = 0
+        k = MixCrypt(k=Key(p=p, g=g), bits=bits, exp_bits=exp_bits).k
+    else:
+        # ElGamal.generate returns a safe prime group, the private key is
+        # generated again with the short exponent
+        k = MixCrypt(bits=bits).k
+        if exp_bits:
+            k = MixCrypt(k=k, bits=bits, exp_bits=exp_bits).k
+    return Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x),
+               exp_bits=exp_bits)
+
 
 class Mixnet(models.Model):
     voting_id = models.PositiveIntegerField()
@@ -28,53 +149,524 @@ class Mixnet(models.Model):
         return "Voting: {}, Auths: {}\nPubKey: {}".format(self.voting_id,
                                                           auths, self.pubkey)
 
+    def get_crypt(self):
+        '''
+        MixCrypt of this auth key, cached by the key id, so the key isn't
+        loaded if it's in the cache
+        '''
+
+        def build():
+            key = self.key
+            return make_crypt((key.p, key.g, key.y, key.x), key.curve,
+                              key.exp_bits)
+        return key_contexts.get(('key', self.key_id), build)
+
+    def spill(self, msgs, n=None):
+        '''
+        Returns the msgs in a DiskBatch if there're more than
+        MIXNET_DISK_BATCH, or if n is bigger, so the shuffle and decrypt
+        work on disk and the results are kept on disk too
+        '''
+
+        limit = settings.MIXNET_DISK_BATCH
+        n = len(msgs) if n is None else n
+        if not limit or n <= limit or msgs_on_disk(msgs):
+            return msgs
+
+        batch = DiskBatch(self.get_crypt().width(), dir=settings.MIXNET_DISK_DIR)
+        if isinstance(msgs, CiphertextBatch):
+            batch.extend_batch(msgs)
+        else:
+            for i in range(0, len(msgs), FACTORS_BATCH):
+                batch.extend(msgs[i:i + FACTORS_BATCH])
+        return batch
+
     def shuffle(self, msgs, pk):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+        crypt = self.get_crypt()
+        self.load_tables(crypt, pk)
+        msgs = self.spill(msgs)
+        # the stored factors are taken for each chunk of msgs
+        factors = lambda n: self.take_factors(n, pk)
 
-        return crypt.shuffle(msgs, pk)
+        return crypt.shuffle(msgs, pk, workers=settings.MIXNET_WORKERS,
+                             factors=factors)
 
-    def decrypt(self, msgs, pk, last=False):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        return crypt.shuffle_decrypt(msgs, last)
+    def get_pubkey(self, pk):
+        '''
+        Returns the Key row for the public key pk, creating it if it
+        doesn't exists
+        '''
 
-    def gen_key(self, p=0, g=0):
-        crypt = MixCrypt(bits=B)
-        if self.key:
-            k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        elif (not g or not p):
-            k = crypt.genk()
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
+        p, g, y = pk
+        # with only one auth its private key has the same p, g and y. The
+        # BigBigField stores a None x as 0
+        key = Key.objects.filter(Q(x__isnull=True) | Q(x=0),
+                                 p=p, g=g, y=y).first()
+        if not key:
+            key = Key(p=p, g=g, y=y, curve=self.key.curve,
+                      exp_bits=self.key.exp_bits)
             key.save()
+        return key
+
+    def precompute(self, n, pk):
+        '''
+        Generates and stores reencryption factors for the public key pk,
+        until there're n stored factors
+        '''
+
+        key = self.get_pubkey(pk)
+        n -= self.factors.filter(key=key).count()
+        if n <= 0:
+            return
+
+        crypt = self.get_crypt()
+        self.load_tables(crypt, pk)
+        for i in range(0, n, FACTORS_BATCH):
+            factors = crypt.gen_factors(min(FACTORS_BATCH, n - i), pk)
+            ReencryptFactor.objects.bulk_create(
+                ReencryptFactor(mixnet=self, key=key, a=a, b=b)
+                for a, b in factors
+            )
+
+    def take_factors(self, n, pk):
+        '''
+        Returns up to n stored reencryption factors for the public key pk,
+        removing them, because each factor should be used only once
+        '''
+
+        p, g, y = pk
+        with transaction.atomic():
+            factors = self.factors.select_for_update().filter(
+                key__p=p, key__g=g, key__y=y)[:n]
+            factors = list(factors)
+            ids = [f.id for f in factors]
+            ReencryptFactor.objects.filter(id__in=ids).delete()
+        return [(f.a, f.b) for f in factors]
+
+    def is_own_pubkey(self, pk):
+        '''
+        True if pk is the public key of this mixnet, or the key of this
+        auth, and not a key sent by the caller
+        '''
 
-            self.key = key
-            self.save()
+        pk = tuple(map(int, pk))
+        keys = (k for k in (self.pubkey, self.key) if k)
+        return any((k.p, k.g, k.y) == pk for k in keys)
+
+    def load_tables(self, crypt, pk):
+        '''
+        Loads the fixed-base tables for the public key pk in the crypt,
+        using the tables stored with the key if there're any, and storing
+        them in other case. The tables are only stored for the own keys,
+        see is_own_pubkey, for other keys they're built in memory.
+        '''
+
+        tables = crypt.tables.get(crypt.pubkey(pk))
+        if tables:
+            return tables
+        if not settings.MIXNET_STORE_TABLES or not self.is_own_pubkey(pk):
+            return crypt.precompute(pk)
+
+        key = self.get_pubkey(pk)
+        if key.precomp:
+            return crypt.precompute(pk, data=bytes(key.precomp))
+
+        tables = crypt.precompute(pk)
+        key.precomp = crypt.dump_tables(pk)
+        key.save()
+        return tables
+
+    def decrypt(self, msgs, pk, last=False, shuffle=True, bound=None):
+        '''
+        Partial decryption of msgs with this auth key, shuffling them if
+        shuffle is True. If bound is not None the msgs are exponential
+        ElGamal aggregates, and the last auth returns the exponents, that
+        should be in [0, bound].
+        '''
+
+        crypt = self.get_crypt()
+        msgs = self.spill(msgs)
+        if shuffle:
+            msgs = crypt.shuffle_decrypt(msgs, last and bound is None,
+                                         workers=settings.MIXNET_WORKERS)
         else:
-            k = crypt.getk(p, g)
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
+            msgs = crypt.multiple_decrypt(msgs, last and bound is None)
 
-            self.key = key
-            self.save()
+        if last and bound is not None:
+            # the group elements g^m are not decoded as messages
+            msgs = [crypt.dlog(m, bound) for a, m in msgs]
+        return msgs
 
-    def chain_call(self, path, data):
-        next_auths=self.next_auths()
+    def result(self, msgs, data):
+        '''
+        Result of the last auth, the clear msgs, or with "histogram" in
+        the request data the number of each msg, { "counts": { msg: n } },
+        and the msgs too with "audit"
+        '''
+
+        if not data.get("histogram"):
+            return msgs
+
+        counts = {}
+        for m in msgs:
+            counts[str(m)] = counts.get(str(m), 0) + 1
+        result = { "counts": counts }
+        if data.get("audit"):
+            result["msgs"] = msgs
+        return result
+
+    def checkpoint(self, path, key, compute):
+        '''
+        Returns the msgs stored with the key by a previous try of the hop,
+        if the checksum is right, or the result of compute, that is stored
+        until the hop is done, see clear_checkpoints.
+        '''
+
+        if not settings.MIXNET_CHECKPOINTS:
+            return compute()
+
+        cp = self.checkpoints.filter(key=key).first()
+        if cp:
+            msgs = cp.load()
+            if msgs is not None:
+                return msgs
+            cp.delete()
+
+        msgs = compute()
+        return MixCheckpoint.store(self, path, key, msgs)
+
+    def clear_checkpoints(self, path):
+        '''
+        Removes the checkpoints of the path, when the result is returned,
+        because the stored permutations are secret
+        '''
+
+        self.checkpoints.filter(path=path).delete()
+
+    def set_shuffled(self, msgs):
+        '''
+        Stores the digest of the msgs returned by the shuffle of the chain,
+        see MixShuffle
+        '''
+
+        MixShuffle.objects.get_or_create(mixnet=self, digest=msgs_digest(msgs))
+
+    def is_shuffled(self, msgs):
+        return self.shuffles.filter(digest=msgs_digest(msgs)).exists()
+
+    def partial_decrypt(self, msgs):
+        '''
+        Decryption shares of the msgs with this auth key, see
+        MixCrypt.partial_decrypt
+        '''
+
+        return self.get_crypt().partial_decrypt(msgs)
+
+    def combine(self, path, data, bound=None):
+        '''
+        Decrypts the data msgs without shuffle, with all the auths
+        computing their decryption shares at the same time, see
+        fanout_call. This auth combines the shares and returns the clear
+        msgs, or the exponents in [0, bound] for exponential ElGamal.
+        '''
+
+        msgs = data.get("msgs", [])
+        crypt = self.get_crypt()
+        shares = self.fanout_call(path, data,
+                                  local=lambda: crypt.partial_decrypt(msgs))
+        for share in shares:
+            if not isinstance(share, list) or len(share) != len(msgs):
+                raise ValueError('bad decryption shares')
+        clears = crypt.combine_shares(msgs, shares)
+        if bound is not None:
+            return [crypt.dlog(m, bound) for m in clears]
+        return [crypt.decode(m) for m in clears]
+
+    def rest_pubkey(self, pk):
+        '''
+        The public key pk without the share of this auth, that is the key
+        of the next auths after the partial decryption of this one
+        '''
+
+        p, g, y = pk
+        return p, g, self.get_crypt().div(y, self.key.y)
+
+    def mix_decrypt(self, msgs, pk, last=False, bound=None):
+        '''
+        Shuffle and partial decryption in one pass. pk is the public key of
+        this auth and the next ones, see rest_pubkey
+        '''
+
+        msgs = self.shuffle(msgs, pk)
+        return self.decrypt(msgs, pk, last=last, shuffle=False, bound=bound)
+
+    def reencrypt_op(self, pk):
+        '''
+        Returns a function that reencrypts a chunk of msgs, using the stored
+        reencryption factors, for the stream protocol
+        '''
+
+        crypt = self.get_crypt()
+        self.load_tables(crypt, pk)
+
+        def op(msgs):
+            factors = self.take_factors(len(msgs), pk)
+            factors += crypt.gen_factors(len(msgs) - len(factors), pk)
+            return crypt.multiple_reencrypt(msgs, pk, factors)
+        return op
+
+    def decrypt_op(self, pk, last=False, bound=None):
+        '''
+        Returns a function that decrypts a chunk of msgs, like decrypt
+        without shuffle, for the stream protocol
+        '''
+
+        crypt = self.get_crypt()
+
+        def op(msgs):
+            msgs = crypt.multiple_decrypt(msgs, last and bound is None)
+            if last and bound is not None:
+                msgs = [crypt.dlog(m, bound) for a, m in msgs]
+            return msgs
+        return op
+
+    def on_arrival(self):
+        '''
+        In the stream protocol the hops alternate the work on the received
+        chunks and on the sent ones, so each hop works on the chunks while
+        the previous one is still working on the next chunks
+        '''
+
+        return self.auth_position % 2 == 1
+
+    def stream(self, path, data, op, shuffle=True):
+        '''
+        Stream protocol, the msgs are received in chunks, data is the
+        request data with the "stream" id, the "chunk" index, the number of
+        "chunks" and the "msgs" of this chunk. op is the function to
+        process the msgs, see reencrypt_op and decrypt_op.
+
+        Returns None until all the chunks are received, and then the msgs
+        are permuted if shuffle is True, and sent in chunks to the next
+        auth. The result is the response of the last chunk in the chain.
+
+        The processed chunks and the permutation are checkpoints, so a
+        retry with the same msgs only process the missing chunks.
+        '''
 
+        stream, count = data["stream"], int(data["chunks"])
+        msgs = data.get("msgs", [])
+        if self.on_arrival():
+            msgs = self.checkpoint(path, checkpoint_key(path, data),
+                                   lambda: op(msgs))
+        chunk = MixChunk(mixnet=self, stream=stream, index=int(data["chunk"]),
+                         msgs=dumps(msgs))
+        chunk.save()
+
+        chunks = self.chunks.filter(stream=stream)
+        if chunks.count() < count:
+            return None
+
+        # the msgs of all the chunks in a batch, without converting them,
+        # that is moved to disk if it's too big, see spill
+        msgs = CiphertextBatch()
+        for c in chunks.order_by('index'):
+            part = loads(bytes(c.msgs), batch=CiphertextBatch.from_wire)
+            msgs = self.spill(msgs, len(msgs) + len(part))
+            msgs.extend_batch(part)
+        chunks.delete()
+
+        data = {k: v for k, v in data.items() if k not in ("msgs", "chunk", "chunks")}
+        key = checkpoint_key(path, dict(data, msgs=msgs))
+
+        # same chunks size than the received ones
+        size = max(-(-len(msgs) // count), 1)
+        perm = range(len(msgs))
+        if shuffle:
+            perm = self.checkpoint(path, key + ':perm', lambda: gen_perm(len(msgs)))
+        if shuffle and msgs_on_disk(msgs):
+            msgs, perm = msgs.permuted(perm), range(len(msgs))
+        out = perm_chunks(msgs, perm, size) if msgs else iter([[]])
+        if not self.on_arrival():
+            out = (self.checkpoint(path, '{}:{}'.format(key, i), lambda: op(c))
+                   for i, c in enumerate(out))
+
+        result = self.chain_stream(path, data, out, max(-(-len(msgs) // size), 1))
+        self.clear_checkpoints(path)
+        return result
+
+    def chain_stream(self, path, data, chunks, count):
+        '''
+        Sends the chunks to the next auth with the stream protocol, in a
+        thread so the next chunk is processed while this one is sent. The
+        "background" data value is useful for tests only, to send them in
+        the request thread.
+        '''
+
+        next_auths = self.next_auths()
+        if not next_auths:
+            return self.result([m for chunk in chunks for m in chunk], data)
+
+        self.chain_data(next_auths, data)
+        auth = next_auths.first().url
+
+        def send(index, chunk):
+            d = dict(data, chunk=index, chunks=count, msgs=chunk)
+            return mods.post('mixnet', entry_point=path, baseurl=auth,
+                             json=d, binary=True)
+
+        if not data.get("background", True):
+            return [send(i, c) for i, c in enumerate(chunks)][-1]
+
+        pending = queue.Queue(maxsize=2)
+        results = []
+
+        def sender():
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                try:
+                    results.append(send(*item))
+                except Exception as e:
+                    results.append(e)
+
+        t = threading.Thread(target=sender)
+        t.daemon = True
+        t.start()
+        for item in enumerate(chunks):
+            pending.put(item)
+        pending.put(None)
+        t.join()
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+        return results[-1]
+
+    def run_job(self, job, data, process):
+        '''
+        Runs the shuffle or decrypt job, process is the function to
+        process the msgs in this auth. The result is sent as a new job to
+        the next auth, that returns without waiting for it, and the last
+        auth sends the result to the job in the first one, the "origin".
+        '''
+
+        origin = data["origin"]
+        jobs = MixJob.objects.filter(pk=job.pk)
+        try:
+            msgs = self.checkpoint(job.path, checkpoint_key(job.path, data),
+                                   lambda: process(data.get("msgs", [])))
+            data = dict(data, msgs=msgs)
+            if self.next_auths():
+                jobs.filter(status='running').update(status='relayed')
+                self.chain_call(job.path, data)
+            else:
+                msgs = self.result(msgs, data)
+                done = { "status": "done", "voting": self.voting_id, "msgs": msgs,
+                         "job_token": data["job_token"] }
+                mods.post('mixnet', entry_point='/job/{}/'.format(job.job_id),
+                          baseurl=origin, json=done, binary=True)
+                # in the first auth the result is already stored
+                jobs.filter(status='running').update(status='done')
+            self.clear_checkpoints(job.path)
+        except Exception as e:
+            jobs.exclude(status__in=('done', 'error')).update(status='error', error=str(e))
+            error = { "status": "error", "voting": self.voting_id, "error": str(e),
+                      "job_token": data["job_token"] }
+            mods.post('mixnet', entry_point='/job/{}/'.format(job.job_id),
+                      baseurl=origin, json=error)
+
+    def gen_key(self, p=0, g=0, curve='', exp_bits=0, bits=B):
+        if self.key:
+            return
+
+        key = None
+        if not curve and (not g or not p):
+            key = KeyPool.take(bits, exp_bits)
+        if not key:
+            key = new_key(bits, p, g, curve, exp_bits)
+            key.save()
+
+        self.key = key
+        self.save()
+
+    def chain_data(self, next_auths, data):
         data.update({
             "auths": AuthSerializer(next_auths, many=True).data,
             "voting": self.voting_id,
             "position": self.auth_position + 1,
         })
+        return data
+
+    def chain_call(self, path, data):
+        next_auths=self.next_auths()
+        self.chain_data(next_auths, data)
 
         if next_auths:
             auth = next_auths.first().url
             r = mods.post('mixnet', entry_point=path,
-                           baseurl=auth, json=data)
+                           baseurl=auth, json=data, binary=True)
             return r
 
         return None
 
+    def fanout_call(self, path, data, local=None):
+        '''
+        Posts the data to all the next auths at the same time, each one
+        with its position and the auths from it, like in chain_call, and
+        "chain" False so it doesn't call the next ones. Returns the
+        responses in the auths order. Each call is signed, see
+        mods.call_signature.
+
+        local is a function to run in this auth while the posts are sent,
+        its result is the first one of the returned list.
+
+        The "background" data value is useful for tests only, to send them
+        in the request thread.
+        '''
+
+        next_auths = list(self.next_auths())
+        calls = []
+        for i, auth in enumerate(next_auths):
+            d = dict(data, chain=False, voting=self.voting_id,
+                     auths=AuthSerializer(next_auths[i:], many=True).data,
+                     position=self.auth_position + i + 1)
+            d["signature"] = mods.call_signature(path, d)
+            calls.append((auth.url, d))
+
+        def send(url, d):
+            return mods.post('mixnet', entry_point=path, baseurl=url,
+                             json=d, binary=True)
+
+        first = [local] if local else []
+        if len(first + calls) < 2 or not data.get("background", True):
+            return [f() for f in first] + [send(*c) for c in calls]
+
+        results = [None] * len(calls)
+
+        def run(i, url, d):
+            try:
+                results[i] = send(url, d)
+            except Exception as e:
+                results[i] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i, ) + c)
+                   for i, c in enumerate(calls)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        first = [f() for f in first]
+        for t in threads:
+            t.join()
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+        return first + results
+
     def next_auths(self):
         next_auths = self.auths.filter(me=False)
 
@@ -82,3 +674,208 @@ class Mixnet(models.Model):
             next_auths = next_auths[1:]
 
         return next_auths
+
+
+@receiver(post_save, sender=Key)
+@receiver(post_delete, sender=Key)
+def discard_key_context(sender, instance, **kwargs):
+    key_contexts.discard(('key', instance.id))
+
+
+class MixChunk(models.Model):
+    '''
+    Chunk of msgs received with the stream protocol, see Mixnet.stream
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="chunks",
+                               on_delete=models.CASCADE)
+    stream = models.CharField(max_length=64)
+    index = models.PositiveIntegerField()
+    # msgs in the base.binary format
+    msgs = models.BinaryField()
+
+
+class MixShuffle(models.Model):
+    '''
+    Digest of the msgs returned by a shuffle of the chain to the first auth,
+    the only votes that it decrypts in PartialDecrypt
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="shuffles",
+                               on_delete=models.CASCADE)
+    digest = models.CharField(max_length=64, db_index=True)
+
+
+class MixCheckpoint(models.Model):
+    '''
+    Result of a hop, or of a chunk in the stream protocol, stored until
+    the hop is done, so if the next auths fail a retry with the same
+    input doesn't process it again, see Mixnet.checkpoint
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="checkpoints",
+                               on_delete=models.CASCADE)
+    path = models.CharField(max_length=200)
+    # checkpoint_key of the input
+    key = models.CharField(max_length=100, db_index=True)
+    # msgs in the base.binary format, and its sha256. For a DiskBatch the
+    # ints are in file, with the sha256 of the file, and msgs has only the
+    # width and the arity
+    msgs = models.BinaryField()
+    file = models.CharField(max_length=400, blank=True, default='')
+    checksum = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def store(cls, mixnet, path, key, msgs):
+        '''
+        Stores the msgs, and returns them like load does, so the result of
+        a hop is the same the first time and when it's resumed
+        '''
+
+        if msgs_on_disk(msgs):
+            # the file of the batch is copied, without loading it in memory
+            fd, name = tempfile.mkstemp(prefix='mixcheckpoint-',
+                                        dir=settings.MIXNET_DISK_DIR)
+            with os.fdopen(fd, 'wb') as f:
+                checksum = msgs.dump(f)
+            data = dumps({ "width": msgs.width, "arity": msgs.arity })
+            cls(mixnet=mixnet, path=path, key=key, msgs=data, file=name,
+                checksum=checksum).save()
+            return msgs
+
+        batch = isinstance(msgs, CiphertextBatch)
+        data = dumps({ "msgs": msgs, "batch": batch })
+        cls(mixnet=mixnet, path=path, key=key, msgs=data,
+            checksum=hashlib.sha256(data).hexdigest()).save()
+        return msgs if batch else loads(data)["msgs"]
+
+    def load(self):
+        '''
+        The stored msgs, a CiphertextBatch, or DiskBatch, if it was stored
+        from one and lists in other case, or None if the checksum is wrong
+        '''
+
+        data = bytes(self.msgs)
+        if self.file:
+            meta = loads(data)
+            try:
+                with open(self.file, 'rb') as f:
+                    msgs, checksum = DiskBatch.load(f, meta["width"], meta["arity"],
+                                                    dir=settings.MIXNET_DISK_DIR)
+            except OSError:
+                return None
+            return msgs if checksum == self.checksum else None
+
+        if hashlib.sha256(data).hexdigest() != self.checksum:
+            return None
+        stored = loads(data, batch=CiphertextBatch.from_wire)
+        msgs = stored["msgs"]
+        if not stored["batch"] and hasattr(msgs, "tolist"):
+            msgs = msgs.tolist()
+        return msgs
+
+
+@receiver(post_delete, sender=MixCheckpoint)
+def remove_checkpoint_file(sender, instance, **kwargs):
+    if instance.file and os.path.exists(instance.file):
+        os.remove(instance.file)
+
+
+class MixJob(models.Model):
+    '''
+    Asynchronous shuffle or decrypt job, see Mixnet.run_job. The job in the
+    first auth gets the result, that the caller can get polling it.
+    '''
+
+    STATUS = (
+        ('running', 'Running'),
+        ('relayed', 'Relayed to the next auth'),
+        ('done', 'Done'),
+        ('error', 'Error'),
+    )
+
+    mixnet = models.ForeignKey(Mixnet, related_name="jobs",
+                               on_delete=models.CASCADE)
+    job_id = models.CharField(max_length=64)
+    path = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=STATUS, default='running')
+    # secret of the job, the result is only accepted with it
+    token = models.CharField(max_length=64, blank=True, default='')
+    # result msgs in the base.binary format, only in the first auth
+    result = models.BinaryField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{} {}: {}".format(self.job_id, self.path, self.status)
+
+
+class ReencryptFactor(models.Model):
+    '''
+    Precomputed reencryption factor (g^r, y^r) for the public key, used
+    once in a shuffle
+    '''
+
+    mixnet = models.ForeignKey(Mixnet, related_name="factors",
+                               on_delete=models.CASCADE)
+    key = models.ForeignKey(Key, related_name="factors",
+                            on_delete=models.CASCADE)
+    a = BigBigField()
+    b = BigBigField()
+
+
+class GroupParams(models.Model):
+    '''
+    Pre-generated (p, g) group parameters, see groups and the
+    mixnet_genparams command
+    '''
+
+    bits = models.PositiveIntegerField()
+    p = BigBigField()
+    g = BigBigField()
+
+    def clean(self):
+        if not check_group(self.p, self.g):
+            raise ValidationError('p should be a safe prime and g a generator of the order q subgroup')
+
+    def __str__(self):
+        return "{} bits: {},{}".format(self.bits, self.p, self.g)
+
+
+class KeyPool(models.Model):
+    '''
+    Keys generated in background, ready to be used by new mixnets
+    '''
+
+    bits = models.PositiveIntegerField()
+    key = models.OneToOneField(Key, related_name="pool",
+                               on_delete=models.CASCADE)
+
+    @classmethod
+    def take(cls, bits, exp_bits=0):
+        '''
+        Returns a Key from the pool removing it, or None if it's empty
+        '''
+
+        with transaction.atomic():
+            entry = cls.objects.select_for_update().filter(
+                bits=bits, key__exp_bits=exp_bits).first()
+            if not entry:
+                return None
+            key = entry.key
+            entry.delete()
+        return key
+
+    @classmethod
+    def fill(cls, bits, size):
+        '''
+        Generates new keys until there're size keys of bits, with the
+        MIXNET_EXPONENT_BITS exponents, in the pool
+        '''
+
+        exp_bits = settings.MIXNET_EXPONENT_BITS
+        while cls.objects.filter(bits=bits, key__exp_bits=exp_bits).count() < size:
+            key = new_key(bits, exp_bits=exp_bits)
+            key.save()
+            cls(bits=bits, key=key).save()
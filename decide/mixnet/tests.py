@@ -1,14 +1,23 @@
+import os
+
 from django.test import TestCase
 from django.conf import settings
+from django.test import override_settings
+from django.db.models import Q
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
-from mixnet.mixcrypt import MixCrypt
+from mixnet.batch import CiphertextBatch
+from mixnet.mixcrypt import MixCrypt, ECMixCrypt
 from mixnet.mixcrypt import ElGamal
+from mixnet.groups import get_group
+from mixnet.models import Key, KeyPool, Mixnet, checkpoint_key
 
 from base import mods
+from base.binary import MEDIA_TYPE, dumps, loads
 
 
+@override_settings(MIXNET_TEST_GROUPS=True)
 class MixnetCase(APITestCase):
 
     def setUp(self):
@@ -44,6 +53,32 @@ class MixnetCase(APITestCase):
         self.assertEqual(type(key["p"]), int)
         self.assertEqual(type(key["y"]), int)
 
+    def test_create_group(self):
+        self.test_create()
+
+        # the key uses the group from the catalogue
+        p, g = get_group(settings.KEYBITS, test=True)
+        self.assertEqual((self.key["p"], self.key["g"]), (p, g))
+
+    def test_create_key_pool(self):
+        KeyPool.fill(settings.KEYBITS, 2)
+        self.assertEqual(KeyPool.objects.count(), 2)
+        key = KeyPool.objects.first().key
+
+        self.test_create()
+        self.assertEqual(KeyPool.objects.count(), 1)
+        self.assertEqual(Mixnet.objects.get(voting_id=1).key, key)
+
+    def test_key_cache(self):
+        self.test_create()
+
+        # the same crypt in each request, until the key changes
+        mn = Mixnet.objects.get(voting_id=1)
+        crypt = mn.get_crypt()
+        self.assertIs(Mixnet.objects.get(voting_id=1).get_crypt(), crypt)
+        mn.key.save()
+        self.assertIsNot(mn.get_crypt(), crypt)
+
     def test_shuffle(self):
         self.test_create()
 
@@ -79,6 +114,128 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(shuffled, encrypt)
 
+    def test_shuffle_tables(self):
+        self.test_shuffle()
+
+        key = Key.objects.get(Q(x__isnull=True) | Q(x=0),
+                              p=self.key["p"], g=self.key["g"], y=self.key["y"])
+        self.assertTrue(key.precomp)
+
+        # the second shuffle loads the stored tables
+        clear = [2, 3, 4, 5]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = { "msgs": encrypt }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(encrypt))
+
+        # the tables of other keys aren't stored
+        other = MixCrypt(k=Key(p=self.key["p"], g=self.key["g"]),
+                         bits=settings.KEYBITS).k
+        pk = self.key["p"], self.key["g"], int(other.y)
+        data = { "msgs": self.encrypt_msgs(clear, pk),
+                 "pk": { "p": pk[0], "g": pk[1], "y": pk[2] } }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Key.objects.filter(y=pk[2]).exists())
+
+    def test_shuffle_batch(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        msgs = CiphertextBatch.from_list(self.encrypt_msgs(clear, pk))
+        mn = Mixnet.objects.get(voting_id=1)
+
+        shuffled = mn.shuffle(msgs, pk)
+        self.assertIsInstance(shuffled, CiphertextBatch)
+        wire = loads(dumps({ "msgs": shuffled }))["msgs"]
+        self.assertEqual(wire, [list(m) for m in shuffled])
+        self.assertEqual(sorted(mn.decrypt(shuffled, pk, last=True)), clear)
+
+    @override_settings(MIXNET_DISK_BATCH=3)
+    def test_shuffle_decrypt_disk(self):
+        self.test_create()
+
+        clear = list(range(2, 15))
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        mn = Mixnet.objects.get(voting_id=1)
+        self.assertTrue(mn.spill(encrypt).on_disk)
+
+        data = { "msgs": encrypt }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+        self.assertEqual(len(shuffled), len(encrypt))
+
+        data = { "msgs": shuffled }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(response.json()), clear)
+
+        # the stream chunks are joined on disk
+        clear1 = mods.post_chunks('mixnet', encrypt, 4, json={ "background": False },
+                                  entry_point='/decrypt/1/')
+        self.assertEqual(sorted(clear1), clear)
+
+    @override_settings(MIXNET_DISK_BATCH=3, MIXNET_CHECKPOINTS=True)
+    def test_shuffle_checkpoint_disk(self):
+        self.test_create()
+
+        clear = list(range(2, 15))
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        mn = Mixnet.objects.get(voting_id=1)
+
+        # the batches on disk are stored in a file until the hop is done
+        path = '/shuffle/1/'
+        key = checkpoint_key(path, { "msgs": encrypt })
+        shuffled = mn.checkpoint(path, key, lambda: mn.shuffle(encrypt, pk))
+        self.assertTrue(shuffled.on_disk)
+        cp = mn.checkpoints.get(key=key)
+        self.assertTrue(os.path.exists(cp.file))
+
+        resumed = mn.checkpoint(path, key, lambda: [])
+        self.assertTrue(resumed.on_disk)
+        self.assertEqual(resumed.to_list(), shuffled.to_list())
+
+        mn.clear_checkpoints(path)
+        self.assertFalse(os.path.exists(cp.file))
+
+    @override_settings(MIXNET_CHECKPOINTS=True)
+    def test_shuffle_checkpoint(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+        mn = Mixnet.objects.get(voting_id=1)
+
+        # a retry gets the stored result if the checksum is right
+        path = '/shuffle/1/'
+        key = checkpoint_key(path, { "msgs": encrypt, "stream": "a" })
+        self.assertEqual(key, checkpoint_key(path, { "msgs": encrypt, "stream": "b" }))
+        shuffled = mn.checkpoint(path, key, lambda: mn.shuffle(encrypt, pk))
+        self.assertIsInstance(shuffled[0], list)
+        self.assertEqual(mn.checkpoint(path, key, lambda: []), shuffled)
+
+        # a batch is resumed as a batch
+        batch = CiphertextBatch.from_list(encrypt)
+        bkey = checkpoint_key(path, { "msgs": batch, "batch": True })
+        shuffled = mn.checkpoint(path, bkey, lambda: mn.shuffle(batch, pk))
+        resumed = mn.checkpoint(path, bkey, lambda: [])
+        self.assertIsInstance(resumed, CiphertextBatch)
+        self.assertEqual(resumed.to_list(), shuffled.to_list())
+
+        mn.checkpoints.update(checksum='bad')
+        self.assertEqual(mn.checkpoint(path, key, lambda: []), [])
+
+        # the checkpoints are removed when the hop is done
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mn.checkpoints.count(), 0)
+
     def test_decrypt(self):
         self.test_create()
 
@@ -102,6 +259,167 @@ class MixnetCase(APITestCase):
 
         self.assertEqual(sorted(clear), sorted(clear2))
 
+    @override_settings(MIXNET_EXPONENT_BITS=64)
+    def test_decrypt_short_exponents(self):
+        self.test_create()
+        self.assertEqual(self.key["exp_bits"], 64)
+        mn = Mixnet.objects.get(voting_id=1)
+        self.assertLess(mn.key.x, 2 ** 64)
+
+        clear = [2, 3, 4, 5, 6]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/mixnet/decrypt/1/', { "msgs": response.json() }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_decrypt_binary(self):
+        self.test_create()
+
+        clear = [2, 3, 4, 5, 6]
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = dumps({ "msgs": encrypt })
+        response = self.client.post('/mixnet/shuffle/1/', data,
+                                    content_type=MEDIA_TYPE, HTTP_ACCEPT=MEDIA_TYPE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], MEDIA_TYPE)
+        shuffled = loads(response.content)
+        self.assertNotEqual(shuffled, encrypt)
+
+        # binary request and JSON response
+        data = dumps({ "msgs": shuffled })
+        response = self.client.post('/mixnet/decrypt/1/', data,
+                                    content_type=MEDIA_TYPE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()), clear)
+
+    def test_precompute(self):
+        self.test_create()
+
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        data = { "n": 10, "pk": self.key, "background": False }
+        response = self.client.post('/mixnet/precompute/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        mn = Mixnet.objects.get(voting_id=1)
+        self.assertEqual(mn.factors.count(), 10)
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = { "msgs": encrypt, "pk": self.key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+
+        # the factors are used only once
+        self.assertEqual(mn.factors.count(), 0)
+
+        data = { "msgs": shuffled, "pk": self.key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    @override_settings(MIXNET_DISK_BATCH=3)
+    def test_precompute_disk(self):
+        '''
+        The factors are taken a chunk at a time for a ballot box on disk
+        '''
+
+        self.test_create()
+
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        data = { "n": 10, "pk": self.key, "background": False }
+        response = self.client.post('/mixnet/precompute/1/', data, format='json')
+        mn = Mixnet.objects.get(voting_id=1)
+        self.assertEqual(mn.factors.count(), 10)
+
+        clear = list(range(2, 15))
+        encrypt = self.encrypt_msgs(clear, pk)
+        data = { "msgs": encrypt, "pk": self.key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+        self.assertEqual(mn.factors.count(), 0)
+
+        data = { "msgs": shuffled, "pk": self.key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+    def test_decrypt_homomorphic(self):
+        self.test_create()
+
+        pk = self.key["p"], self.key["g"], self.key["y"]
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct(pk)
+
+        # three options, 4 votes
+        votes = [[1, 0, 0], [0, 1, 0], [1, 0, 0], [1, 0, 0]]
+        aggs = []
+        p = pk[0]
+        for i in range(3):
+            a, b = 1, 1
+            for v in votes:
+                ca, cb = k.encrypt_exp(v[i])
+                a, b = (a * ca) % p, (b * cb) % p
+            aggs.append([a, b])
+
+        data = { "msgs": aggs, "shuffle": False, "bound": len(votes) }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [3, 1, 0])
+
+    def test_shuffle_decrypt_ec(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" }
+            ],
+            "key": { "p": 0, "g": 0, "curve": "P-256" },
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        key = response.json()
+        self.assertEqual(key["curve"], "P-256")
+
+        pk = key["p"], key["g"], key["y"]
+        k = ECMixCrypt(key=pk)
+        clear = [2, 3, 4, 5]
+        encrypt = [k.encrypt(i) for i in clear]
+
+        data = { "msgs": encrypt }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        shuffled = response.json()
+        self.assertNotEqual(shuffled, encrypt)
+
+        data = { "msgs": shuffled }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()), clear)
+
+        # homomorphic aggregates
+        votes = [[1, 0], [1, 0], [0, 1]]
+        aggs = []
+        for i in range(2):
+            a, b = 0, 0
+            for v in votes:
+                ca, cb = k.encrypt_exp(v[i])
+                a, b = k.mul(a, ca), k.mul(b, cb)
+            aggs.append([a, b])
+
+        data = { "msgs": aggs, "shuffle": False, "bound": len(votes) }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [2, 1])
+
+    @override_settings(MIXNET_WORKERS=2)
+    def test_decrypt_workers(self):
+        self.test_decrypt()
+
     def test_multiple_auths(self):
         '''
         This test emulates a two authorities shuffle and decryption.
@@ -158,6 +476,31 @@ class MixnetCase(APITestCase):
         self.assertNotEqual(clear, clear2)
         self.assertEqual(sorted(clear), sorted(clear2))
 
+    @override_settings(MIXNET_FANOUT_KEYGEN=True)
+    def test_create_fanout(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+                { "name": "auth3", "url": "http://127.0.0.2:8000" },
+            ],
+            "background": False,
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        key = response.json()
+
+        # the same mixnets than with the chained call
+        mixnets = Mixnet.objects.filter(voting_id=1).order_by('auth_position')
+        self.assertEqual([mn.auth_position for mn in mixnets], [0, 1, 2])
+        self.assertEqual([mn.auths.count() for mn in mixnets], [3, 2, 1])
+
+        y = 1
+        for mn in mixnets:
+            y = (y * mn.key.y) % key["p"]
+        self.assertEqual(key["y"], y)
+
     def test_multiple_auths_mock(self):
         '''
         This test emulates a two authorities shuffle and decryption.
@@ -188,3 +531,192 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(clear, clear1)
         self.assertEqual(sorted(clear), sorted(clear1))
+
+    @override_settings(BINARY_WIRE=True)
+    def test_multiple_auths_stream(self):
+        '''
+        Two authorities shuffle and decryption, sending the msgs in chunks
+        '''
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 15))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        # the chunks are removed when the stream is complete
+        data = { "pk": key, "background": False }
+        response = mods.post_chunks('mixnet', encrypt[:5], 2, json=data,
+                                    entry_point='/shuffle/1/', response=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(Mixnet.objects.get(auth_position=0).chunks.all()), 0)
+
+        shuffled = mods.post_chunks('mixnet', encrypt, 4, json=data,
+                                    entry_point='/shuffle/1/')
+        self.assertEqual(len(shuffled), len(encrypt))
+        self.assertNotEqual(shuffled, encrypt)
+
+        clear1 = mods.post_chunks('mixnet', shuffled, 4, json=data,
+                                  entry_point='/decrypt/1/', binary=True)
+        self.assertNotEqual(clear, clear1)
+        self.assertEqual(sorted(clear), sorted(clear1))
+
+        # it stops at the first failed chunk, there's no mixnet for voting 2
+        response = mods.post_chunks('mixnet', encrypt, 4, json=data,
+                                    entry_point='/shuffle/2/', response=True)
+        self.assertEqual(response.status_code, 404)
+        with self.assertRaises(ValueError):
+            mods.post_chunks('mixnet', encrypt, 4, json=data,
+                             entry_point='/shuffle/2/')
+
+    def test_multiple_auths_partial(self):
+        '''
+        Two authorities decryption at the same time, combined by the first
+        one
+        '''
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 15))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = { "msgs": encrypt, "pk": key }
+        shuffled = self.client.post('/mixnet/shuffle/1/', data, format='json').json()
+
+        # only the signed calls are decrypted
+        data = { "msgs": shuffled, "background": False }
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        data["signature"] = mods.call_signature('/partial/1/', data)
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        clear1 = response.json()
+        self.assertEqual(sorted(clear), sorted(clear1))
+
+        # and only the votes of a shuffle, or msgs that aren't votes
+        data = { "msgs": encrypt, "background": False }
+        data["signature"] = mods.call_signature('/partial/1/', data)
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        data["shuffle"] = False
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), clear)
+
+        # the shares are only returned in the signed calls of the first auth
+        data = { "msgs": encrypt, "chain": False, "position": 0 }
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        data["position"] = 1
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        data["signature"] = mods.call_signature('/partial/1/', data)
+        response = self.client.post('/mixnet/partial/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(encrypt))
+
+        # and the first auth checks them
+        mn = Mixnet.objects.get(voting_id=1, auth_position=0)
+        mn.fanout_call = lambda path, data, local=None: [local(), [1]]
+        with self.assertRaises(ValueError):
+            mn.combine('/partial/1/', { "msgs": shuffled })
+
+    def test_multiple_auths_job(self):
+        '''
+        Two authorities shuffle and decryption as jobs, getting the result
+        from the first auth
+        '''
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 15))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = { "msgs": encrypt, "pk": key, "async": True, "background": False }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()["job"]
+
+        response = self.client.get('/mixnet/job/{}/'.format(job), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "done")
+        shuffled = response.json()["msgs"]
+        self.assertEqual(len(shuffled), len(encrypt))
+
+        # only the last auth, with the job token, can set the result
+        fake = { "voting": 1, "status": "done", "msgs": [], "job_token": "fake" }
+        response = self.client.post('/mixnet/job/{}/'.format(job), fake, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        data = { "msgs": shuffled, "pk": key, "async": True, "background": False }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()["job"]
+
+        response = self.client.get('/mixnet/job/{}/'.format(job), format='json')
+        self.assertEqual(response.json()["status"], "done")
+        self.assertEqual(sorted(response.json()["msgs"]), clear)
+
+    def test_multiple_auths_mixdecrypt(self):
+        '''
+        Two authorities shuffle and decryption in one pass
+        '''
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = list(range(2, 15))
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = { "msgs": encrypt }
+        response = self.client.post('/mixnet/mixdecrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        clear1 = response.json()
+        self.assertNotEqual(clear, clear1)
+        self.assertEqual(sorted(clear), sorted(clear1))
+
+        # precomputed factors for the key of each auth
+        data = { "n": 5, "pk": key, "background": False, "combined": True }
+        response = self.client.post('/mixnet/precompute/1/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        for mn in Mixnet.objects.filter(voting_id=1):
+            self.assertEqual(mn.factors.count(), 5)
+
+        data = { "msgs": encrypt, "stream": "s1", "chunk": 0, "chunks": 1,
+                 "background": False }
+        response = self.client.post('/mixnet/mixdecrypt/1/', data, format='json')
+        self.assertEqual(sorted(response.json()), clear)
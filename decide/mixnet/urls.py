@@ -9,4 +9,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('shuffle/<int:voting_id>/', views.Shuffle.as_view(), name='shuffle'),
     path('decrypt/<int:voting_id>/', views.Decrypt.as_view(), name='decrypt'),
+    path('mixdecrypt/<int:voting_id>/', views.MixDecrypt.as_view(), name='mixdecrypt'),
+    path('partial/<int:voting_id>/', views.PartialDecrypt.as_view(), name='partial'),
+    path('precompute/<int:voting_id>/', views.Precompute.as_view(), name='precompute'),
+    path('job/<str:job_id>/', views.MixnetJob.as_view(), name='job'),
 ]
@@ -1,14 +1,88 @@
+import hmac
+import secrets
+import threading
+import uuid
+
 from django.conf import settings
+from django.db import connection
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .serializers import MixnetSerializer
-from .models import Auth, Mixnet, Key
+from .models import Auth, Mixnet, MixJob, Key, KeyPool, B, checkpoint_key
+from base import mods
+from base.binary import dumps, loads
 from base.serializers import KeySerializer, AuthSerializer
 
 
+def precompute_task(mn, n, pk):
+    try:
+        mn.precompute(n, pk)
+    finally:
+        connection.close()
+
+
+def job_task(mn, job, data, process):
+    try:
+        mn.run_job(job, data, process)
+    finally:
+        connection.close()
+
+
+def start_job(mn, path, data, process):
+    '''
+    Creates the job to process the msgs in background, and returns the
+    response with the job id without waiting for it
+    '''
+
+    if mn.auth_position:
+        # relayed by the previous auth of the chain
+        job_id, token = data["job"], data.get("job_token", "")
+    else:
+        # the secret token that the last auth sends back with the result
+        job_id, token = uuid.uuid4().hex, secrets.token_hex(32)
+    data = dict(data, job=job_id, job_token=token,
+                origin=data.get("origin", settings.BASEURL))
+    data.pop("async", None)
+    job = MixJob(mixnet=mn, job_id=job_id, path=path, token=token)
+    job.save()
+
+    # useful for tests only, to run the job in the request
+    if data.get("background", True):
+        t = threading.Thread(target=job_task, args=(mn, job, data, process))
+        t.daemon = True
+        t.start()
+    else:
+        mn.run_job(job, data, process)
+
+    return Response({ "job": job_id }, status=status.HTTP_202_ACCEPTED)
+
+
+# only one thread filling the key pool for each process
+key_pool_lock = threading.Lock()
+
+
+def fill_key_pool_task(bits, size):
+    if not key_pool_lock.acquire(blocking=False):
+        return
+    try:
+        KeyPool.fill(bits, size)
+    finally:
+        key_pool_lock.release()
+        connection.close()
+
+
+def fill_key_pool():
+    if not settings.MIXNET_KEY_POOL:
+        return
+    t = threading.Thread(target=fill_key_pool_task,
+                         args=(B, settings.MIXNET_KEY_POOL))
+    t.daemon = True
+    t.start()
+
+
 class MixnetViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows mixnets to be viewed or edited.
@@ -23,7 +97,12 @@ class MixnetViewSet(viewsets.ModelViewSet):
          * auths: [ {"name": str, "url": str} ]
          * voting: id
          * position: int / nullable
-         * key: { "p": int, "g": int } / nullable
+         * key: { "p": int, "g": int, "bits": int, "curve": str,
+           "exp_bits": int } / nullable, bits of the group, KEYBITS by
+           default, curve for elliptic curve ElGamal, see mixnet.ecgroup,
+           and exp_bits for short exponents, MIXNET_EXPONENT_BITS by default
+         * chain: bool / nullable, false to only gen the key of this auth,
+           used by the first auth with MIXNET_FANOUT_KEYGEN
         """
 
         auths = request.data.get("auths")
@@ -31,6 +110,9 @@ class MixnetViewSet(viewsets.ModelViewSet):
         key = request.data.get("key", {"p": 0, "g": 0})
         position = request.data.get("position", 0)
         p, g = int(key["p"]), int(key["g"])
+        bits = int(key.get("bits", B))
+        curve = key.get("curve", "")
+        exp_bits = int(key.get("exp_bits", settings.MIXNET_EXPONENT_BITS))
 
         dbauths = []
         for auth in auths:
@@ -46,21 +128,33 @@ class MixnetViewSet(viewsets.ModelViewSet):
         for a in dbauths:
             mn.auths.add(a)
 
-        mn.gen_key(p, g)
+        mn.gen_key(p, g, curve, exp_bits, bits)
 
-        data = { "key": { "p": mn.key.p, "g": mn.key.g } }
-        # chained call to the next auth to gen the key
-        resp = mn.chain_call("/", data)
-        if resp:
-            y = (resp["y"] * mn.key.y) % mn.key.p
-        else:
-            y = mn.key.y
+        data = { "key": { "p": mn.key.p, "g": mn.key.g, "bits": bits,
+                          "curve": mn.key.curve, "exp_bits": mn.key.exp_bits } }
+        chain = request.data.get("chain", True)
+        y = mn.key.y
+        if chain and settings.MIXNET_FANOUT_KEYGEN:
+            # all the next auths gen the key at the same time, without
+            # calling the next ones, and this auth combines the keys
+            data["background"] = request.data.get("background", True)
+            for resp in mn.fanout_call("/", data):
+                y = mn.get_crypt().mul(resp["y"], y)
+        elif chain:
+            # chained call to the next auth to gen the key
+            resp = mn.chain_call("/", data)
+            if resp:
+                y = mn.get_crypt().mul(resp["y"], y)
 
-        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y)
+        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y, curve=mn.key.curve,
+                     exp_bits=mn.key.exp_bits)
         pubkey.save()
         mn.pubkey = pubkey
         mn.save()
 
+        # a new key for the next mixnet
+        fill_key_pool()
+
         return  Response(KeySerializer(pubkey, many=False).data)
 
 
@@ -72,6 +166,9 @@ class Shuffle(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+         * stream: str / nullable, to send the msgs in chunks, with the
+           chunk index and the number of chunks, see Mixnet.stream
+         * async: bool / nullable, to run it as a job, see MixnetJob
         """
 
         position = request.data.get("position", 0)
@@ -84,16 +181,36 @@ class Shuffle(APIView):
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
 
-        msgs = mn.shuffle(msgs, (p, g, y))
+        if "stream" in request.data:
+            data = dict(request.data, pk={ "p": p, "g": g, "y": y })
+            msgs = mn.stream("/shuffle/{}/".format(voting_id), data,
+                             mn.reencrypt_op((p, g, y)))
+            if msgs is None:
+                return Response({ "received": data["chunk"] })
+            if not position:
+                mn.set_shuffled(msgs)
+            return Response(msgs)
+
+        if request.data.get("async") or request.data.get("job"):
+            data = dict(request.data, pk={ "p": p, "g": g, "y": y })
+            process = lambda msgs: mn.shuffle(msgs, (p, g, y))
+            return start_job(mn, "/shuffle/{}/".format(voting_id), data, process)
+
+        path = "/shuffle/{}/".format(voting_id)
+        key = checkpoint_key(path, dict(request.data, pk={ "p": p, "g": g, "y": y }))
+        msgs = mn.checkpoint(path, key, lambda: mn.shuffle(msgs, (p, g, y)))
 
         data = {
             "msgs": msgs,
             "pk": { "p": p, "g": g, "y": y },
         }
         # chained call to the next auth to gen the key
-        resp = mn.chain_call("/shuffle/{}/".format(voting_id), data)
+        resp = mn.chain_call(path, data)
+        mn.clear_checkpoints(path)
         if resp:
             msgs = resp
+        if not position:
+            mn.set_shuffled(msgs)
 
         return  Response(msgs)
 
@@ -106,6 +223,13 @@ class Decrypt(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+         * shuffle: bool / nullable, false to keep the msgs order
+         * bound: int / nullable, to decode exponential ElGamal msgs
+         * stream: str / nullable, like in shuffle
+         * async: bool / nullable, like in shuffle
+         * histogram: bool / nullable, the last auth returns the number of
+           each clear msg, { "counts": { msg: int } }
+         * audit: bool / nullable, with histogram, the clear msgs too
         """
 
         position = request.data.get("position", 0)
@@ -124,15 +248,250 @@ class Decrypt(APIView):
         # useful for tests only, to override the last value
         last = request.data.get("force-last", last)
 
-        msgs = mn.decrypt(msgs, (p, g, y), last=last)
+        shuffle = request.data.get("shuffle", True)
+        bound = request.data.get("bound", None)
+
+        if "stream" in request.data:
+            data = dict(request.data, pk={ "p": p, "g": g, "y": y })
+            data.pop("force-last", None)
+            op = mn.decrypt_op((p, g, y), last=last, bound=bound)
+            msgs = mn.stream("/decrypt/{}/".format(voting_id), data, op,
+                             shuffle=shuffle)
+            if msgs is None:
+                return Response({ "received": data["chunk"] })
+            return Response(msgs)
+
+        if request.data.get("async") or request.data.get("job"):
+            data = dict(request.data, pk={ "p": p, "g": g, "y": y })
+            data.pop("force-last", None)
+            process = lambda msgs: mn.decrypt(msgs, (p, g, y), last=last,
+                                              shuffle=shuffle, bound=bound)
+            return start_job(mn, "/decrypt/{}/".format(voting_id), data, process)
+
+        path = "/decrypt/{}/".format(voting_id)
+        key = checkpoint_key(path, dict(request.data, pk={ "p": p, "g": g, "y": y }))
+        msgs = mn.checkpoint(path, key, lambda: mn.decrypt(msgs, (p, g, y), last=last,
+                                                           shuffle=shuffle, bound=bound))
 
         data = {
             "msgs": msgs,
             "pk": { "p": p, "g": g, "y": y },
+            "shuffle": shuffle,
+            "bound": bound,
+            "histogram": request.data.get("histogram", False),
+            "audit": request.data.get("audit", False),
         }
         # chained call to the next auth to gen the key
-        resp = mn.chain_call("/decrypt/{}/".format(voting_id), data)
+        resp = mn.chain_call(path, data)
+        mn.clear_checkpoints(path)
         if resp:
             msgs = resp
+        elif last:
+            msgs = mn.result(msgs, data)
 
         return  Response(msgs)
+
+
+class MixDecrypt(APIView):
+
+    def post(self, request, voting_id):
+        """
+        Shuffle and decrypt in one pass: each auth reencrypts, shuffles and
+        decrypts with its key, and the last one returns the clear msgs
+
+         * voting_id: id
+         * msgs: [ [int, int] ]
+         * pk: { "p": int, "g": int, "y": int } / nullable, the public key
+           of this auth and the next ones, the voting key by default
+         * position: int / nullable
+         * bound: int / nullable, like in decrypt
+         * stream: str / nullable, like in shuffle
+         * async: bool / nullable, like in shuffle
+         * histogram, audit: bool / nullable, like in decrypt
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        msgs = request.data.get("msgs", [])
+        pk = request.data.get("pk", None)
+        if pk:
+            p, g, y = pk["p"], pk["g"], pk["y"]
+        else:
+            key = mn.pubkey or mn.key
+            p, g, y = key.p, key.g, key.y
+
+        last = mn.next_auths().count() == 0
+        bound = request.data.get("bound", None)
+
+        # the next auths decrypt with the key without this auth share
+        _, _, next_y = mn.rest_pubkey((p, g, y))
+        path = "/mixdecrypt/{}/".format(voting_id)
+        data = dict(request.data, pk={ "p": p, "g": g, "y": next_y })
+
+        if "stream" in request.data:
+            reencrypt = mn.reencrypt_op((p, g, y))
+            decrypt = mn.decrypt_op((p, g, y), last=last, bound=bound)
+            msgs = mn.stream(path, data, lambda msgs: decrypt(reencrypt(msgs)))
+            if msgs is None:
+                return Response({ "received": data["chunk"] })
+            return Response(msgs)
+
+        process = lambda msgs: mn.mix_decrypt(msgs, (p, g, y), last=last,
+                                              bound=bound)
+        if request.data.get("async") or request.data.get("job"):
+            return start_job(mn, path, data, process)
+
+        key = checkpoint_key(path, data)
+        data["msgs"] = mn.checkpoint(path, key, lambda: process(msgs))
+        resp = mn.chain_call(path, data)
+        mn.clear_checkpoints(path)
+        if resp:
+            return Response(resp)
+        return Response(mn.result(data["msgs"], data))
+
+
+class PartialDecrypt(APIView):
+
+    def post(self, request, voting_id):
+        """
+        Decryption without shuffle, of msgs already shuffled, where all the
+        auths compute their decryption shares at the same time, and the
+        first auth combines them and returns the clear msgs
+
+         * voting_id: id
+         * msgs: [ [int, int] ]
+         * position: int / nullable
+         * bound: int / nullable, like in decrypt
+         * histogram, audit: bool / nullable, like in decrypt
+         * shuffle: bool / nullable, false for msgs that aren't the
+           result of the last shuffle, like the homomorphic aggregates
+         * chain: bool / nullable, false in the calls of the first auth,
+           that returns only the decryption shares of this auth
+         * signature: str, of the voting, or of the first auth in its
+           calls, see mods.call_signature
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        path = "/partial/{}/".format(voting_id)
+        msgs = request.data.get("msgs", [])
+        # only signed calls, of the voting to the first auth, that combines
+        # the shares, and of the first auth to the other ones
+        chain = request.data.get("chain", True)
+        signature = str(request.data.get("signature", ""))
+        if bool(position) == bool(chain) or \
+           not hmac.compare_digest(mods.call_signature(path, request.data), signature):
+            return Response({}, status=status.HTTP_403_FORBIDDEN)
+        if not chain:
+            return Response(mn.partial_decrypt(msgs))
+
+        # the votes are only decrypted after the shuffle
+        if request.data.get("shuffle", True) and not mn.is_shuffled(msgs):
+            return Response({}, status=status.HTTP_403_FORBIDDEN)
+
+        bound = request.data.get("bound", None)
+        data = {
+            "msgs": msgs,
+            "background": request.data.get("background", True),
+        }
+        try:
+            msgs = mn.combine(path, data, bound=bound)
+        except ValueError:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(mn.result(msgs, request.data))
+
+
+class Precompute(APIView):
+
+    def post(self, request, voting_id):
+        """
+        Generates in background the reencryption factors for the next
+        shuffle, in this auth and the next ones
+
+         * voting_id: id
+         * n: int, number of factors, the number of votes expected
+         * pk: { "p": int, "g": int, "y": int } / nullable
+         * position: int / nullable
+         * combined: bool / nullable, for the mixdecrypt, where each auth
+           uses the key without the shares of the previous ones
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+
+        n = int(request.data.get("n", 0))
+        combined = request.data.get("combined", False)
+        pk = request.data.get("pk", None)
+        if pk:
+            p, g, y = pk["p"], pk["g"], pk["y"]
+        else:
+            p, g, y = mn.key.p, mn.key.g, mn.key.y
+
+        # useful for tests only, to generate the factors in the request
+        background = request.data.get("background", True)
+
+        if background:
+            t = threading.Thread(target=precompute_task, args=(mn, n, (p, g, y)))
+            t.daemon = True
+            t.start()
+        else:
+            mn.precompute(n, (p, g, y))
+
+        if combined:
+            p, g, y = mn.rest_pubkey((p, g, y))
+
+        data = {
+            "n": n,
+            "pk": { "p": p, "g": g, "y": y },
+            "background": background,
+            "combined": combined,
+        }
+        mn.chain_call("/precompute/{}/".format(voting_id), data)
+
+        return  Response({})
+
+
+class MixnetJob(APIView):
+
+    def get(self, request, job_id):
+        """
+        Status of the job, with the result msgs when it's done
+
+        Returns { "status": str, "msgs": [ [int, int] ], "error": str }
+        """
+
+        job = get_object_or_404(MixJob, job_id=job_id, mixnet__auth_position=0)
+        data = { "status": job.status, "error": job.error }
+        if job.status == 'done':
+            data["msgs"] = loads(bytes(job.result))
+        return Response(data)
+
+    def post(self, request, job_id):
+        """
+        The last auth sends here the result of the job
+
+         * voting: id
+         * job_token: str, the secret of the job sent through the chain
+         * status: "done" or "error"
+         * msgs: [ [int, int] ] / nullable
+         * error: str / nullable
+        """
+
+        voting = request.data.get("voting")
+        job = get_object_or_404(MixJob, job_id=job_id, mixnet__auth_position=0,
+                                mixnet__voting_id=voting)
+        token = str(request.data.get("job_token", ""))
+        if not job.token or not hmac.compare_digest(job.token, token):
+            return Response({}, status=status.HTTP_403_FORBIDDEN)
+        if job.status in ('done', 'error'):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        job.status = request.data.get("status", "done")
+        job.error = request.data.get("error", "")
+        job.result = dumps(request.data.get("msgs", []))
+        job.save()
+        if job.status == 'done' and job.path.startswith('/shuffle/'):
+            job.mixnet.set_shuffled(request.data.get("msgs", []))
+        return Response({})
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_auto_20180921_1522'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='option',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
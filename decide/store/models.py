@@ -6,6 +6,9 @@ class Vote(models.Model):
     voting_id = models.PositiveIntegerField()
     voter_id = models.PositiveIntegerField()
     question_id = models.PositiveIntegerField()
+    # option number for the homomorphic tally votes, with a ciphertext for
+    # each option
+    option = models.PositiveIntegerField(blank=True, null=True)
 
     a = BigBigField()
     b = BigBigField()
@@ -2,14 +2,16 @@ import datetime
 import random
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.test import override_settings
 from django.utils import timezone
 
 from .models import Vote
 from .serializers import VoteSerializer
 from base import mods
-from base.models import Auth
+from base.models import Auth, Key
 from base.tests import BaseTestCase
 from census.models import Census
+from mixnet.ecgroup import get_curve
 
 from voting.models import Question, QuestionOption
 from voting.models import Voting
@@ -202,4 +204,100 @@ class StoreTextCase(BaseTestCase):
         self.voting.end_date = timezone.now() - datetime.timedelta(days=1)
         self.voting.save()
         response = self.client.post('/store/', data, format='json')
-        self.assertEqual(response.status_code, 401)
\ No newline at end of file
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(HOMOMORPHIC_TRUSTED_CLIENTS=True)
+    def test_store_tally(self):
+        VOTING_PK = 345
+        voting = self.gen_voting(VOTING_PK)
+        voting.pub_key = Key.objects.create(p=101, g=2, y=3)
+        voting.tally_mode = 'homomorphic'
+        voting.save()
+
+        # the users 1 and 2 are the ones of setUp
+        for voter in (3, 4):
+            Census(voting_id=VOTING_PK, voter_id=voter).save()
+            user = self.get_or_create_user(voter)
+            self.login(user=user.username)
+            # the second vote replaces the first one
+            for a in (1, 2 * voter):
+                data = {
+                    "voting": VOTING_PK,
+                    "voter": voter,
+                    "question": 1,
+                    "vote": [
+                        { "option": 1, "a": a, "b": 3 },
+                        { "option": 2, "a": 5, "b": 7 * voter },
+                    ] + [{ "option": o, "a": 1, "b": 1 } for o in (3, 4, 5)]
+                }
+                response = self.client.post('/store/', data, format='json')
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(Vote.objects.filter(voting_id=VOTING_PK).count(), 10)
+
+        self.login()
+        response = self.client.get('/store/tally/?voting_id={}'.format(VOTING_PK), format='json')
+        self.assertEqual(response.status_code, 200)
+        tally = response.json()
+        self.assertEqual(tally["voters"], 2)
+        self.assertEqual(tally["options"], [
+            { "question": 1, "option": 1, "a": 6 * 8 % 101, "b": 9 },
+            { "question": 1, "option": 2, "a": 25, "b": 21 * 28 % 101 },
+        ] + [{ "question": 1, "option": o, "a": 1, "b": 1 } for o in (3, 4, 5)])
+
+    def test_store_homomorphic_invalid(self):
+        VOTING_PK = 345
+        voting = self.gen_voting(VOTING_PK)
+        voting.pub_key = Key.objects.create(p=101, g=2, y=3)
+        voting.tally_mode = 'homomorphic'
+        voting.save()
+
+        Census(voting_id=VOTING_PK, voter_id=3).save()
+        user = self.get_or_create_user(3)
+        self.login(user=user.username)
+        vote = [{ "option": o, "a": 2, "b": 3 } for o in range(1, 6)]
+        data = { "voting": VOTING_PK, "voter": 3, "question": 1, "vote": vote }
+
+        # only with trusted clients
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(HOMOMORPHIC_TRUSTED_CLIENTS=True):
+            bad = [
+                vote[:4],
+                vote + vote[:1],
+                vote[:4] + [{ "option": 6, "a": 2, "b": 3 }],
+                vote[0],
+            ]
+            for v in bad:
+                response = self.client.post('/store/', dict(data, vote=v), format='json')
+                self.assertEqual(response.status_code, 400)
+            self.assertEqual(Vote.objects.filter(voting_id=VOTING_PK).count(), 0)
+
+            response = self.client.post('/store/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(Vote.objects.filter(voting_id=VOTING_PK).count(), 5)
+
+    def test_store_ec_points(self):
+        VOTING_PK = 345
+        voting = self.gen_voting(VOTING_PK)
+        c = get_curve('P-256')
+        G = c.encode(c.G)
+        voting.pub_key = Key.objects.create(p=c.p, g=G, y=G, curve='P-256')
+        voting.save()
+
+        Census(voting_id=VOTING_PK, voter_id=3).save()
+        user = self.get_or_create_user(3)
+        self.login(user=user.username)
+        data = { "voting": VOTING_PK, "voter": 3, "question": 1 }
+
+        # off the curve, the infinity and not a point
+        for a in (G + 2, 0, 'a'):
+            response = self.client.post('/store/', dict(data, vote={ "a": a, "b": G }),
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Vote.objects.filter(voting_id=VOTING_PK).count(), 0)
+
+        response = self.client.post('/store/', dict(data, vote={ "a": G, "b": G }),
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path('', views.StoreView.as_view(), name='store'),
+    path('tally/', views.StoreTally.as_view(), name='store-tally'),
 ]
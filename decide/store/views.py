@@ -1,14 +1,34 @@
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 import django_filters.rest_framework
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics
+from rest_framework.views import APIView
 
 from .models import Vote
 from .serializers import VoteSerializer
 from base import mods
 from base.perms import UserIsStaff
+from mixnet.ecgroup import get_curve
+
+
+def valid_points(curve, vote):
+    '''
+    True if all the ciphertexts of the vote are two points of the curve,
+    without the infinity, for the EC ElGamal votings
+    '''
+
+    for opt in vote:
+        for n in (opt.get("a"), opt.get("b")):
+            try:
+                if curve.decode(n) is None:
+                    return False
+            except (TypeError, ValueError):
+                return False
+    return True
 
 
 class StoreView(generics.ListAPIView):
@@ -20,6 +40,10 @@ class StoreView(generics.ListAPIView):
     def get(self, request):
         self.permission_classes = (UserIsStaff,)
         self.check_permissions(request)
+        if request.accepted_renderer.format == 'bin':
+            # only the ciphertexts, in the binary format
+            votes = self.filter_queryset(self.get_queryset())
+            return Response([[v.a, v.b] for v in votes.iterator()])
         return super().get(request)
 
     def post(self, request):
@@ -27,7 +51,11 @@ class StoreView(generics.ListAPIView):
          * voting: id
          * voter: id
          * question: id
-         * vote: [{ "a": int, "b": int }, { "a": int, "b": int }, ...]
+         * vote: { "a": int, "b": int }
+           or for homomorphic tally a ciphertext for each option:
+           [{ "option": int, "a": int, "b": int }, ...]
+
+        A new vote of the same voter and question replaces the previous one
         """
 
         vid = request.data.get('voting')
@@ -63,14 +91,80 @@ class StoreView(generics.ListAPIView):
         if perms.status_code == 401:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
-        a = vote.get("a")
-        b = vote.get("b")
+        homomorphic = voting[0].get('tally_mode') == 'homomorphic'
+        if isinstance(vote, list) != homomorphic:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        if homomorphic:
+            # without proofs the ciphertexts can't be checked, only that
+            # there's one for each option of the question
+            if not settings.HOMOMORPHIC_TRUSTED_CLIENTS:
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            q = [q for q in voting[0].get('question', []) if str(q['id']) == str(question)]
+            try:
+                numbers = sorted(int(opt["option"]) for opt in vote)
+            except (TypeError, KeyError, ValueError):
+                numbers = None
+            if not q or numbers != sorted(o['number'] for o in q[0]['options']):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            vote = [vote]
 
-        defs = { "a": a, "b": b }
-        v, _ = Vote.objects.get_or_create(voting_id=vid, voter_id=uid, question_id =question,defaults=defs)
-        v.a = a
-        v.b = b
+        pub_key = voting[0].get('pub_key') or {}
+        if pub_key.get('curve') and not valid_points(get_curve(pub_key['curve']), vote):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
-        v.save()
+        with transaction.atomic():
+            Vote.objects.filter(voting_id=vid, voter_id=uid, question_id=question).delete()
+            for opt in vote:
+                Vote(voting_id=vid, voter_id=uid, question_id=question,
+                     option=opt.get("option", None), a=opt.get("a"), b=opt.get("b")).save()
 
         return  Response({})
+
+
+class StoreTally(APIView):
+
+    def get(self, request):
+        """
+        Homomorphic tally, multiplies the ciphertexts of each option
+
+         * voting_id: id
+
+        Returns the number of voters and the aggregated ciphertext of each
+        option: { "voters": int, "options": [{ "question": id, "option": int, "a": int, "b": int }] }
+        """
+
+        self.permission_classes = (UserIsStaff,)
+        self.check_permissions(request)
+
+        vid = request.GET.get('voting_id')
+        voting = mods.get('voting', params={'id': vid})
+        if not voting or not isinstance(voting, list) or not voting[0].get('pub_key'):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        pub_key = voting[0]['pub_key']
+        p = int(pub_key['p'])
+
+        if pub_key.get('curve'):
+            # elliptic curve ElGamal, the group operation is the point
+            # addition and 0 is the encoding of the infinity point
+            c = get_curve(pub_key['curve'])
+            one = 0
+            mul = lambda x, y: c.encode(c.add(c.decode(x), c.decode(y)))
+        else:
+            one = 1
+            mul = lambda x, y: (x * y) % p
+
+        aggs = {}
+        voters = set()
+        votes = Vote.objects.filter(voting_id=vid, option__isnull=False)
+        for v in votes.iterator():
+            voters.add(v.voter_id)
+            k = (v.question_id, v.option)
+            a, b = aggs.get(k, (one, one))
+            aggs[k] = (mul(a, v.a), mul(b, v.b))
+
+        options = [
+            { "question": q, "option": o, "a": a, "b": b }
+            for (q, o), (a, b) in sorted(aggs.items())
+        ]
+        return Response({ "voters": len(voters), "options": options })
@@ -18,6 +18,9 @@ from .filters import StartedFilter
 def start(modeladmin, request, queryset):
     for v in queryset.all():
         v.create_pubkey()
+        if not v.packing_fits():
+            messages.error(request, "The ballot of {} is too big to be packed".format(v.name))
+            continue
         v.start_date = timezone.now()
         voter=request.user.id
 
@@ -26,6 +29,7 @@ def start(modeladmin, request, queryset):
                 Census.objects.get_or_create(voter_id=u.id, voting_id=v.id)
         
         v.save()
+        v.precompute_mixnet(request.session.get('auth-token', ''))
 
 
 def stop(ModelAdmin, request, queryset):
@@ -38,22 +42,21 @@ def tally(ModelAdmin, request, queryset):
     
     for v in queryset.filter(end_date__lt=timezone.now()):
         token = request.session.get('auth-token', '')
-        v.tally_votes(request.user,token)
+        try:
+            v.tally_votes(request.user,token)
+        except ValueError as e:
+            messages.error(request, 'Tally of {} failed, try again to resume it: {}'.format(v, e))
+            continue
         messages.info(request,send_message(v, v.tally))
         
 
  
 def send_message(v,tally):
     msg="The options that have received votes are the following: "
-    votos = tally
-    dicc = dict()
-    for voto in votos:
-        try:
-            i = dicc[voto]
-            dicc[voto] = i +1
-        except:
-            dicc.update({voto: 1})
+    dicc = v.tally_counts()
     for number in dicc:
+        if not dicc[number]:
+            continue
         msg = msg + "for option: " + QuestionOption.objects.get(number=number).option + " there has been " + str(dicc[number]) + " votes "
     return msg    
 
@@ -82,7 +85,7 @@ class QuestionAdmin(admin.ModelAdmin):
                 messages.add_message(request, messages.ERROR, "This question cannot be deleted because it is part of a started voting")
 
 class VotingAdmin(admin.ModelAdmin):
-    list_display = ('name', 'start_date', 'end_date')
+    list_display = ('name', 'start_date', 'end_date', 'tally_mode')
     readonly_fields = ('start_date', 'end_date', 'pub_key',
                        'tally', 'postproc', 'total_votes','census_total')
     date_hierarchy = 'start_date'
@@ -1,5 +1,4 @@
 import random
-import itertools
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
@@ -9,8 +8,7 @@ from django.utils import timezone
 from base import mods
 from base.models import Auth
 from census.models import Census
-from mixnet.mixcrypt import MixCrypt
-from mixnet.mixcrypt import ElGamal
+from mixnet.models import get_crypt
 from voting.models import Voting, Question, QuestionOption
 
 
@@ -20,10 +18,7 @@ class Command(BaseCommand):
 
     def encrypt_msg(self, msg, v, bits=settings.KEYBITS):
         pk = v.pub_key
-        p, g, y = (pk.p, pk.g, pk.y)
-        k = MixCrypt(bits=bits)
-        k.k = ElGamal.construct((p, g, y))
-        return k.encrypt(msg)
+        return get_crypt((pk.p, pk.g, pk.y), pk.curve, pk.exp_bits).encrypt(msg)
 
     def create_voting(self):
         q = Question(desc='test question')
@@ -82,9 +77,8 @@ class Command(BaseCommand):
         print("Tally")
         v.tally_votes()
 
-        tally = v.tally
-        tally.sort()
-        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+        # the tally can be a list of msgs or a histogram
+        tally = v.tally_counts()
 
         print("Result:")
         for q in v.question.options.all():
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0003_auto_20180605_0842'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='tally_mode',
+            field=models.CharField(choices=[('mixnet', 'Mixnet'), ('homomorphic', 'Homomorphic')], default='mixnet', max_length=20),
+        ),
+    ]
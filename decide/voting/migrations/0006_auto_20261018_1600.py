@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_voting_curve'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voting',
+            name='tally_mode',
+            field=models.CharField(choices=[('mixnet', 'Mixnet'), ('homomorphic', 'Homomorphic'), ('packed', 'Mixnet, packed ballot')], default='mixnet', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0 on 2026-10-18 20:00
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0006_auto_20261018_1600'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='tally_audit',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.0 on 2026-10-18 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0007_voting_tally_audit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TallyStep',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(max_length=20)),
+                ('input', models.CharField(max_length=64)),
+                ('checksum', models.CharField(max_length=64)),
+                ('msgs', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tally_steps', to='voting.Voting')),
+            ],
+        ),
+    ]
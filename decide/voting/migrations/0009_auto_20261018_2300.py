@@ -0,0 +1,23 @@
+# Generated by Django 2.0 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_tallystep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='exp_bits',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voting',
+            name='keybits',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -11,9 +11,12 @@ from django.core.exceptions import ValidationError
 
 
 from base import mods
+from base.binary import dumps, loads
 from base.models import Auth, Key
 
 import datetime
+import hashlib
+import time
 from django.contrib.auth.models import User
 
 
@@ -52,6 +55,17 @@ class QuestionOption(models.Model):
 
 
 class Voting(models.Model):
+    TALLY_MODES = (
+        ('mixnet', 'Mixnet'),
+        ('homomorphic', 'Homomorphic'),
+        ('packed', 'Mixnet, packed ballot'),
+    )
+
+    CURVES = (
+        ('', 'ElGamal'),
+        ('P-256', 'EC ElGamal P-256'),
+    )
+
     name = models.CharField(max_length=200, unique=True)
     desc = models.TextField(blank=True, null=True)
     question = models.ManyToManyField(Question, related_name='voting')
@@ -64,15 +78,48 @@ class Voting(models.Model):
     pub_key = models.OneToOneField(Key, related_name='voting', blank=True, null=True, on_delete=models.SET_NULL)
     auths = models.ManyToManyField(Auth, related_name='votings')
 
+    # mixnet: the votes are shuffled and decrypted one by one
+    # homomorphic: exponential ElGamal, a ciphertext for each option that
+    # is aggregated in the store, and only the aggregates are decrypted.
+    # Only with HOMOMORPHIC_TRUSTED_CLIENTS, the ballots aren't proved
+    # packed: mixnet with the options of all the questions packed in one
+    # ciphertext for each voter, see pack_ballot
+    tally_mode = models.CharField(max_length=20, choices=TALLY_MODES, default='mixnet')
+    # elliptic curve for the voting key, empty for finite field ElGamal
+    curve = models.CharField(max_length=20, choices=CURVES, blank=True, default='')
+    # bits of the finite field ElGamal group and of the exponents, KEYBITS
+    # and MIXNET_EXPONENT_BITS if they aren't set, see crypto_profile
+    keybits = models.PositiveIntegerField(blank=True, null=True)
+    exp_bits = models.PositiveIntegerField(blank=True, null=True)
+
     tally = JSONField(blank=True, null=True)
+    # all the clear votes, only with MIXNET_AUDIT and a histogram tally
+    tally_audit = JSONField(blank=True, null=True)
     postproc = JSONField(blank=True, null=True)
 
     def clean(self):
         
         if isinstance(self.start_date,datetime.datetime):
             raise ValidationError('Voting started cannot be updated.')
+        if self.tally_mode == 'homomorphic' and not settings.HOMOMORPHIC_TRUSTED_CLIENTS:
+            raise ValidationError('The homomorphic tally needs trusted clients.')
 
             
+    def crypto_profile(self):
+        '''
+        Parameters of the voting key: bits of the group, curve for EC
+        ElGamal or empty for finite field, and bits of the exponents
+        '''
+
+        exp_bits = self.exp_bits
+        if exp_bits is None:
+            exp_bits = settings.MIXNET_EXPONENT_BITS
+        return {
+            "bits": self.keybits or settings.KEYBITS,
+            "curve": self.curve,
+            "exp_bits": exp_bits,
+        }
+
     def create_pubkey(self):
         if self.pub_key or not self.auths.count():
             return
@@ -81,32 +128,188 @@ class Voting(models.Model):
         data = {
             "voting": self.id,
             "auths": [ {"name": a.name, "url": a.url} for a in self.auths.all() ],
+            "key": dict(self.crypto_profile(), p=0, g=0),
         }
         key = mods.post('mixnet', baseurl=auth.url, json=data)
-        pk = Key(p=key["p"], g=key["g"], y=key["y"])
+        pk = Key(p=key["p"], g=key["g"], y=key["y"], curve=key.get("curve", ""),
+                 exp_bits=key.get("exp_bits", 0))
         pk.save()
         self.pub_key = pk
         self.save()
 
+    def precompute_mixnet(self, token=''):
+        '''
+        Asks the mixnet to generate the reencryption factors while the
+        voting is open, one for each expected ciphertext, see
+        ballots_per_voter
+        '''
+
+        if not settings.MIXNET_PRECOMPUTE or not self.pub_key:
+            return
+        if self.tally_mode == 'homomorphic':
+            return
+
+        census = mods.get('census', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
+        n = len(census.get('voters', [])) * self.ballots_per_voter()
+
+        auth = self.auths.first()
+        pk = self.pub_key
+        data = {
+            "n": n,
+            "pk": { "p": pk.p, "g": pk.g, "y": pk.y },
+            "combined": settings.MIXNET_COMBINED,
+        }
+        mods.post('mixnet', entry_point='/precompute/{}/'.format(self.id),
+                  baseurl=auth.url, json=data)
+
+    def ballot_layout(self):
+        '''
+        Option numbers of each question, in the order used to pack the
+        ballots
+        '''
+
+        return [[o.number for o in q.options.order_by('number')]
+                for q in self.question.order_by('id')]
+
+    def pack_ballot(self, numbers):
+        '''
+        Packs the selected option number of each question, or None for a
+        blank one, in a single int: each question is a digit in base the
+        number of options plus one, 0 for blank. 1 is added because 0 can't
+        be encrypted with ElGamal.
+        '''
+
+        m = 0
+        for options, number in reversed(list(zip(self.ballot_layout(), numbers))):
+            digit = options.index(number) + 1 if number is not None else 0
+            m = m * (len(options) + 1) + digit
+        return m + 1
+
+    def unpack_ballot(self, m, layout=None):
+        '''
+        Selected option numbers of the packed ballot m, without the blank
+        questions
+        '''
+
+        m = int(m) - 1
+        numbers = []
+        for options in layout or self.ballot_layout():
+            m, digit = divmod(m, len(options) + 1)
+            if digit:
+                numbers.append(options[digit - 1])
+        return numbers
+
+    def packing_fits(self):
+        '''
+        True if the biggest packed ballot can be encrypted with the voting
+        key, always True for other tally modes
+        '''
+
+        if self.tally_mode != 'packed' or not self.pub_key:
+            return True
+
+        size = 1
+        for options in self.ballot_layout():
+            size *= len(options) + 1
+        # the EC ElGamal messages use 8 bits of the point x coordinate
+        limit = self.pub_key.p >> 8 if self.pub_key.curve else self.pub_key.p
+        return size + 1 < limit
+
+    def ballots_per_voter(self):
+        '''
+        Number of ciphertexts stored by each voter, one packed ballot for
+        all the questions in packed mode, or one for each question
+        '''
+
+        if self.tally_mode == 'packed' and self.packing_fits():
+            return 1
+        return self.question.count()
+
     def get_votes(self, token=''):
         # gettings votes from store
-        votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
+        votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token,
+                         binary=True)
         #count votes
         self.total_votes = len(votes)
+        self.set_census_total(token)
+        # anon votes, the binary response has only the ciphertexts
+        return [[i['a'], i['b']] if isinstance(i, dict) else i for i in votes]
+
+    def set_census_total(self, token=''):
         #get census porcentage
         census = mods.get('census', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
         census_number = census.get('voters')
         if len(census_number) != 0:
             self.census_total = 100 * self.total_votes/len(census_number)
-        # anon votes
-        return [[i['a'], i['b']] for i in votes]
-        
+
+    def tally_homomorphic(self, token=''):
+        '''
+        The store multiplies the ciphertexts of each option, and the mixnet
+        decrypts only these aggregates, without shuffle
+        '''
+
+        aggs = mods.get('store', entry_point='/tally/', params={'voting_id': self.id},
+                        HTTP_AUTHORIZATION='Token ' + token)
+        self.total_votes = aggs['voters']
+        self.set_census_total(token)
+
+        auth = self.auths.first()
+        decrypt_url = "/decrypt/{}/".format(self.id)
+        if settings.MIXNET_PARALLEL_DECRYPT:
+            decrypt_url = "/partial/{}/".format(self.id)
+        options = aggs['options']
+        data = {
+            "msgs": [[o['a'], o['b']] for o in options],
+            "shuffle": False,
+            "bound": self.total_votes,
+        }
+        data["signature"] = mods.call_signature(decrypt_url, data)
+        response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
+                response=True, binary=True)
+        self.check_mixnet(response)
+
+        counts = mods.data(response)
+        return {str(o['option']): c for o, c in zip(options, counts)}
+
+    def tally_counts(self):
+        '''
+        Number of votes of each option number, for any tally format
+        '''
+
+        tally = self.tally or []
+        if not isinstance(tally, dict):
+            # list of clear msgs
+            hist = {}
+            for m in tally:
+                hist[m] = hist.get(m, 0) + 1
+            tally = hist
+
+        if self.tally_mode != 'packed':
+            return {int(k): v for k, v in tally.items()}
+
+        layout = self.ballot_layout()
+        counts = {}
+        for m, n in tally.items():
+            # the packed ballots start at 1, the rest are invalid votes
+            if int(m) < 1:
+                continue
+            for number in self.unpack_ballot(m, layout):
+                counts[number] = counts.get(number, 0) + n
+        return counts
 
     def tally_votes(self,user,token=''):
         '''
-        The tally is a shuffle and then a decrypt
+        The tally is a shuffle and then a decrypt, or both in one pass with
+        MIXNET_COMBINED. If the mixnet fails a ValueError is raised, and a
+        new try resumes from the last finished step, see tally_step.
         '''
 
+        if self.tally_mode == 'homomorphic':
+            self.tally = self.tally_homomorphic(token)
+            self.save()
+            self.do_postproc(self.get_user(user))
+            return
+
         votes = self.get_votes(token)
 
         auth = self.auths.first()
@@ -114,25 +317,118 @@ class Voting(models.Model):
         decrypt_url = "/decrypt/{}/".format(self.id)
         auths = [{"name": a.name, "url": a.url} for a in self.auths.all()]
 
-        # first, we do the shuffle
-        data = { "msgs": votes }
-        response = mods.post('mixnet', entry_point=shuffle_url, baseurl=auth.url, json=data,
-                response=True)
-        if response.status_code != 200:
-            # TODO: manage error
-            pass
+        # the last auth can count the votes, see mixnet.views.Decrypt
+        data = {}
+        if settings.MIXNET_HISTOGRAM:
+            data = { "histogram": True, "audit": settings.MIXNET_AUDIT }
+
+        if settings.MIXNET_COMBINED:
+            result = self.post_mixnet("/mixdecrypt/{}/".format(self.id), votes, auth, data)
+        else:
+            # first, we do the shuffle
+            shuffled = self.tally_step('shuffle', votes,
+                                       lambda: self.post_mixnet(shuffle_url, votes, auth))
+
+            # then, we can decrypt that
+            if settings.MIXNET_PARALLEL_DECRYPT:
+                # all the auths at the same time, without shuffle
+                partial_url = "/partial/{}/".format(self.id)
+                data = dict(data, msgs=shuffled)
+                data["signature"] = mods.call_signature(partial_url, data)
+                response = mods.post('mixnet', entry_point=partial_url,
+                                     baseurl=auth.url, json=data,
+                                     response=True, binary=True)
+                self.check_mixnet(response)
+                result = mods.data(response)
+            else:
+                result = self.post_mixnet(decrypt_url, shuffled, auth, data)
+
+        if isinstance(result, dict):
+            self.tally = result["counts"]
+            self.tally_audit = result.get("msgs")
+        else:
+            self.tally = result
+        self.save()
+        self.tally_steps.all().delete()
+        self.do_postproc(self.get_user(user))
 
-        # then, we can decrypt that
-        data = {"msgs": response.json()}
-        response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
-                response=True)
+    def tally_step(self, step, msgs, compute):
+        '''
+        Result of the tally step for the input msgs, stored by a previous
+        try if the checksum is right, or the result of compute, that is
+        stored until the tally is done
+        '''
+
+        if not settings.MIXNET_CHECKPOINTS:
+            return compute()
+
+        digest = hashlib.sha256(dumps(msgs)).hexdigest()
+        for s in self.tally_steps.filter(step=step, input=digest):
+            data = bytes(s.msgs)
+            if hashlib.sha256(data).hexdigest() == s.checksum:
+                return loads(data)
+            s.delete()
+
+        result = compute()
+        data = dumps(result)
+        TallyStep(voting=self, step=step, input=digest, msgs=data,
+                  checksum=hashlib.sha256(data).hexdigest()).save()
+        return result
+
+    def check_mixnet(self, response):
+        '''
+        Raises a ValueError if the mixnet response is an error
+        '''
 
         if response.status_code != 200:
-            # TODO: manage error
-            pass
+            raise ValueError('mixnet error {}: {}'.format(response.status_code,
+                                                          response.content[:200]))
 
-        self.tally = response.json()
-        self.save()
+    def post_mixnet(self, entry_point, msgs, auth, data=None):
+        '''
+        Posts the msgs, with the extra data, to the mixnet and returns the
+        result. With MIXNET_ASYNC it's a mixnet job, and with
+        MIXNET_STREAM_CHUNK the msgs are sent in chunks.
+        '''
+
+        data = data or {}
+        if settings.MIXNET_ASYNC:
+            data = dict(data, msgs=msgs)
+            data["async"] = True
+            job = mods.post('mixnet', entry_point=entry_point, baseurl=auth.url,
+                            json=data, binary=True)
+            return self.wait_mixnet_job(job["job"], auth)
+
+        size = settings.MIXNET_STREAM_CHUNK
+        if size:
+            response = mods.post_chunks('mixnet', msgs, size, json=data, entry_point=entry_point,
+                                        baseurl=auth.url, response=True, binary=True)
+        else:
+            response = mods.post('mixnet', entry_point=entry_point, baseurl=auth.url,
+                                 json=dict(data, msgs=msgs), response=True, binary=True)
+        self.check_mixnet(response)
+        return mods.data(response)
+
+    def wait_mixnet_job(self, job_id, auth):
+        '''
+        Polls the mixnet job until it's done, and returns the result msgs.
+        Raises ValueError if it isn't done in MIXNET_JOB_TIMEOUT seconds.
+        '''
+
+        entry_point = '/job/{}/'.format(job_id)
+        deadline = time.monotonic() + settings.MIXNET_JOB_TIMEOUT
+        while True:
+            job = mods.get('mixnet', entry_point=entry_point, baseurl=auth.url,
+                           binary=True)
+            if job["status"] == 'done':
+                return job["msgs"]
+            if job["status"] == 'error':
+                raise ValueError('mixnet job error: {}'.format(job["error"]))
+            if time.monotonic() >= deadline:
+                raise ValueError('mixnet job {} timed out'.format(job_id))
+            time.sleep(settings.MIXNET_JOB_POLL)
+
+    def get_user(self, user):
         usuario_salida=User(user)
         try:
             usuario_salida.email=user.email
@@ -140,21 +436,17 @@ class Voting(models.Model):
         except:
             usuario_salida.email=usuario_salida.email
             usuario_salida.username=usuario_salida.username
-        self.do_postproc(usuario_salida)
+        return usuario_salida
 
     def do_postproc(self,user):
-        tally = self.tally
+        tally = self.tally_counts()
         questions = self.question.all()
         opts = []
         
         for q in questions:
             options = q.options.all()
             for opt in options:
-                if isinstance(tally, list):
-                    votes = tally.count(opt.number)
-                                        
-                else:
-                    votes = 0
+                votes = tally.get(opt.number, 0)
                 opts.append({
                     'question': opt.question.desc,
                     'question_id':opt.question.id,
@@ -162,7 +454,7 @@ class Voting(models.Model):
                     'number': opt.number,
                     'votes': votes
                 })
-        votes= int(len(tally)/len(questions))
+        votes= int(sum(tally.values())/len(questions))
         data = { 'type': 'IDENTITY', 'options': opts }
         postp = mods.post('postproc', json=data)
         self.postproc = postp
@@ -187,3 +479,22 @@ class Voting(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class TallyStep(models.Model):
+    '''
+    Result of a finished step of the mixnet tally, so a failed tally
+    resumes from it, see Voting.tally_step
+    '''
+
+    voting = models.ForeignKey(Voting, related_name='tally_steps', on_delete=models.CASCADE)
+    step = models.CharField(max_length=20)
+    # sha256 of the input msgs, and of the result msgs
+    input = models.CharField(max_length=64)
+    checksum = models.CharField(max_length=64)
+    # result msgs in the base.binary format
+    msgs = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{}: {}'.format(self.voting, self.step)
@@ -25,7 +25,8 @@ class VotingSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Voting
         fields = ('id', 'name', 'desc', 'question', 'start_date', 'total_votes',
-                  'end_date', 'pub_key', 'auths', 'tally', 'postproc','census_total')
+                  'end_date', 'pub_key', 'auths', 'tally', 'postproc','census_total',
+                  'tally_mode', 'curve', 'keybits', 'exp_bits')
 
 
 class SimpleVotingSerializer(serializers.HyperlinkedModelSerializer):
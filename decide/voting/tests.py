@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.test import TestCase
+from django.test import override_settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 from django.db import IntegrityError
@@ -95,13 +96,15 @@ class VotingTestCase(BaseTestCase):
                     data = {
                         'voting': v.id,
                         'voter': voter.voter_id,
+                        'question': q.id,
                         'vote': { 'a': a, 'b': b },
                     }
                     clear[opt.number] += 1
                     user = self.get_or_create_user(voter.voter_id)
                     self.login(user=user.username)
                     voter = voters.pop()
-                    mods.post('store', json=data)
+                    response = mods.post('store', json=data, response=True)
+                    self.assertEqual(response.status_code, 200)
         return clear
     
 
@@ -429,6 +432,166 @@ class VotingTestCase(BaseTestCase):
 
         self.assertEquals(5, len(clear))
     
+    def test_tally_packed(self):
+        v = self.create_voting('vot packed')
+        q = Question(desc='test question 2')
+        q.save()
+        for i in range(3):
+            opt = QuestionOption(question=q, option='option {}'.format(i+1))
+            opt.save()
+        v.question.add(q)
+        v.tally_mode = 'packed'
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+        self.assertTrue(v.packing_fits())
+        # one packed ballot for both questions
+        self.assertEqual(v.ballots_per_voter(), 1)
+
+        layout = v.ballot_layout()
+        numbers = [layout[0][2], None]
+        self.assertEqual(v.unpack_ballot(v.pack_ballot(numbers)), [layout[0][2]])
+
+        clear = {}
+        for voter in Census.objects.filter(voting_id=v.id)[:10]:
+            numbers = [random.choice(options + [None]) for options in layout]
+            for n in numbers:
+                if n is not None:
+                    clear[n] = clear.get(n, 0) + 1
+            a, b = self.encrypt_msg(v.pack_ballot(numbers), v)
+            data = {
+                'voting': v.id,
+                'voter': voter.voter_id,
+                'question': q.id,
+                'vote': { 'a': a, 'b': b },
+            }
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            mods.post('store', json=data)
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(len(v.tally), 10)
+        self.assertEqual(v.tally_counts(), clear)
+
+    @override_settings(HOMOMORPHIC_TRUSTED_CLIENTS=True)
+    def test_tally_homomorphic(self):
+        v = self.create_voting('vot homomorphic')
+        v.tally_mode = 'homomorphic'
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        # exponential ElGamal, g^1 for the selected option and g^0 for the rest
+        q = v.question.first()
+        numbers = [o.number for o in q.options.all()]
+        pk = v.pub_key
+        k = MixCrypt(k=ElGamal.construct((pk.p, pk.g, pk.y)), bits=settings.KEYBITS)
+        k.k = ElGamal.construct((pk.p, pk.g, pk.y))
+        def ballot(selected):
+            vote = []
+            for n in numbers:
+                a, b = k.encrypt(pk.g if n == selected else 1)
+                vote.append({ 'option': n, 'a': a, 'b': b })
+            return vote
+
+        clear = {n: 0 for n in numbers}
+        for voter in Census.objects.filter(voting_id=v.id)[:6]:
+            user = self.get_or_create_user(voter.voter_id)
+            self.login(user=user.username)
+            data = { 'voting': v.id, 'voter': voter.voter_id, 'question': q.id }
+
+            # a ballot without all the options is rejected
+            response = mods.post('store', json=dict(data, vote=ballot(numbers[0])[1:]),
+                                 response=True)
+            self.assertEqual(response.status_code, 400)
+
+            # and a new vote replaces the previous one
+            for selected in (numbers[0], random.choice(numbers)):
+                response = mods.post('store', json=dict(data, vote=ballot(selected)),
+                                     response=True)
+                self.assertEqual(response.status_code, 200)
+            clear[selected] += 1
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(v.total_votes, 6)
+        self.assertEqual(v.tally_counts(), clear)
+
+    def test_tally_profile(self):
+        v = self.create_voting('vot profile')
+        v.keybits = 512
+        v.exp_bits = 64
+        v.save()
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+        self.assertEqual(v.pub_key.p.bit_length(), 512)
+        self.assertEqual(v.pub_key.exp_bits, 64)
+
+        clear = {n: c for n, c in self.store_votes(v).items() if c}
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(v.tally_counts(), clear)
+
+    @override_settings(BINARY_WIRE=True, MIXNET_STREAM_CHUNK=4, MIXNET_COMBINED=True,
+                       MIXNET_CHECKPOINTS=True, MIXNET_FANOUT_KEYGEN=True,
+                       MIXNET_DISK_BATCH=5)
+    def test_tally_optimized(self):
+        v = self.create_voting('vot optimized')
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = {n: c for n, c in self.store_votes(v).items() if c}
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(v.tally_counts(), clear)
+
+    @override_settings(MIXNET_PARALLEL_DECRYPT=True)
+    def test_tally_parallel(self):
+        v = self.create_voting('vot parallel')
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = {n: c for n, c in self.store_votes(v).items() if c}
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(v.tally_counts(), clear)
+
+    @override_settings(MIXNET_HISTOGRAM=True, MIXNET_AUDIT=True)
+    def test_tally_histogram(self):
+        v = self.create_voting('vot histogram')
+        self.create_voters(v)
+
+        v.create_pubkey()
+        v.start_date = timezone.now()
+        v.save()
+
+        clear = {n: c for n, c in self.store_votes(v).items() if c}
+
+        self.login()
+        v.tally_votes(User.objects.get(username='admin'), self.token)
+        self.assertEqual(v.tally, {str(k): n for k, n in clear.items()})
+        self.assertEqual(v.tally_counts(), clear)
+        self.assertEqual(sorted(v.tally_audit), sorted(n for n, c in clear.items() for i in range(c)))
+
     def test_email_not_send(self):
         v = self.create_voting('vot4')
         self.create_voters(v)
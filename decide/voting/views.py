@@ -68,6 +68,9 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
             if voting.start_date:
                 msg = 'Voting already started'
                 st = status.HTTP_400_BAD_REQUEST
+            elif not voting.packing_fits():
+                msg = 'Ballot too big to be packed'
+                st = status.HTTP_400_BAD_REQUEST
             else:
                 for u in User.objects.all():
                     if(u.is_superuser):
@@ -75,6 +78,7 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
                 
                 voting.start_date = timezone.now()
                 voting.save()
+                voting.precompute_mixnet(request.auth.key)
                 msg = 'Voting started'
         elif action == 'stop':
             if not voting.start_date:
@@ -98,8 +102,13 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
                 msg = 'Voting already tallied'
                 st = status.HTTP_400_BAD_REQUEST
             else:
-                voting.tally_votes(request.auth.key)
-                msg = 'Voting tallied'
+                try:
+                    voting.tally_votes(request.auth.key)
+                    msg = 'Voting tallied'
+                except ValueError as e:
+                    # the next try resumes from the last finished step
+                    msg = 'Tally failed, try again to resume it: {}'.format(e)
+                    st = status.HTTP_502_BAD_GATEWAY
         else:
             msg = 'Action not found, try with start, stop or tally'
             st = status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,277 @@
+"""
+Micro-benchmarks of mixnet.mixcrypt, without the django project, so they
+run offline. Each operation is run for each key size and batch size, and
+the results, ops/sec and peak memory, are printed and can be stored in a
+JSON file and compared with a previous one:
+
+    $ python bench_mixcrypt.py --bits 256 2048 --sizes 1000 10000 --out base.json
+    $ python bench_mixcrypt.py --bits 256 2048 --sizes 1000 10000 --baseline base.json
+
+With --baseline the exit status is 1 if any result is slower, or uses more
+memory, than the baseline by more than the tolerance, and 2 if the baseline
+was run with other options, see COMPARABLE.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'decide'))
+
+from mixnet.arith import get_backend
+from mixnet.batch import CiphertextBatch
+from mixnet.groups import get_group
+from mixnet.mixcrypt import ECMixCrypt, MixCrypt
+from mixnet.mixcrypt import gen_multiple_key, multiple_decrypt_shuffle
+
+
+BITS = [256, 1024, 2048, 3072]
+SIZES = [1000]
+OPS = ['keygen', 'encrypt', 'reencrypt', 'shuffle', 'shuffle_decrypt',
+       'multiple_decrypt_shuffle']
+
+# number of keys generated by the keygen benchmark, that doesn't depend on
+# the batch size
+KEYGEN_COUNT = 20
+
+# allowed slowdown, or memory increase, against the baseline
+TOLERANCE = 0.2
+
+# environment values that must be the same in the baseline to compare them
+COMPARABLE = ['backend', 'batch', 'workers', 'exp_bits', 'auths']
+
+
+def new_crypt(args, group, label):
+    """
+    New MixCrypt with a private key for the group, the curve name for EC
+    ElGamal or the (p, g) of a finite field group
+    """
+    if isinstance(group, str):
+        return ECMixCrypt(curve=group, backend=args.backend)
+    p, g = group
+    return MixCrypt(k=SimpleNamespace(p=p, g=g), bits=label,
+                    backend=args.backend, exp_bits=args.exp_bits)
+
+
+def get_groups(args):
+    """
+    (label, group) of each key size, with the groups of the catalogue when
+    there's one, the test ones too, so the keys aren't generated with new
+    safe primes
+    """
+    groups = []
+    for bits in args.bits:
+        group = get_group(bits, test=True)
+        if not group:
+            print("Generating a group of {} bits, it can be slow".format(bits))
+            k = MixCrypt(bits=bits).k
+            group = int(k.p), int(k.g)
+        groups.append((bits, group))
+    for curve in args.curve:
+        groups.append((curve, curve))
+    return groups
+
+
+def cases(args, label, group, size, ops):
+    """
+    Yields (op, ops, run) for the size, with run doing ops operations. The
+    ciphertexts are generated before, and aren't part of the time.
+    """
+    crypts = [new_crypt(args, group, label) for i in range(args.auths)]
+    pub = gen_multiple_key(*crypts)
+    pk = pub.pubkey()
+    pub.precompute()
+    crypts[0].precompute(pk)
+
+    rnd = random.Random(args.seed)
+    clears = [rnd.randint(2, 1000) for i in range(size)]
+
+    def msgs(cipher):
+        if args.batch:
+            return CiphertextBatch.from_list(cipher, width=pub.width())
+        return cipher
+
+    cipher = None
+    cipher1 = None
+    for op in ops:
+        if op == 'keygen':
+            yield op, KEYGEN_COUNT, lambda: [new_crypt(args, group, label)
+                                             for i in range(KEYGEN_COUNT)]
+        elif op == 'encrypt':
+            yield op, size, lambda: [pub.encrypt(m) for m in clears]
+        else:
+            if cipher is None:
+                cipher = msgs([pub.encrypt(m) for m in clears])
+            if op == 'reencrypt':
+                yield op, size, lambda: pub.multiple_reencrypt(cipher)
+            elif op == 'shuffle':
+                yield op, size, lambda: crypts[0].shuffle(cipher, pk, workers=args.workers)
+            elif op == 'shuffle_decrypt':
+                # a single auth, with its own key
+                if cipher1 is None:
+                    cipher1 = msgs([crypts[0].encrypt(m) for m in clears])
+                yield op, size, lambda: crypts[0].shuffle_decrypt(cipher1, workers=args.workers)
+            elif op == 'multiple_decrypt_shuffle':
+                yield op, size, lambda: multiple_decrypt_shuffle(cipher, *crypts)
+
+
+def measure(args, ops, run):
+    """
+    Best time of args.repeat runs, and the peak of memory allocated by one
+    run, traced with tracemalloc in another run so it doesn't slow the
+    timed ones
+    """
+    best = None
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        run()
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+
+    peak = None
+    if args.memory:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "seconds": best,
+        "ops_per_sec": ops / best if best else 0,
+        "peak_bytes": peak,
+    }
+
+
+def result_key(r):
+    return "{}/{}/{}".format(r["op"], r["bits"], r["size"])
+
+
+def print_result(r):
+    mem = '-'
+    if r["peak_bytes"] is not None:
+        mem = '{:.1f} MiB'.format(r["peak_bytes"] / (1 << 20))
+    print("{:<26} {:>6} {:>8} {:>14.1f} ops/s {:>12}".format(
+          r["op"], r["bits"], r["size"], r["ops_per_sec"], mem))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the results against the baseline ones, and returns the keys of
+    the regressions
+    """
+    base = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    print("\nAgainst the baseline:")
+    for r in results:
+        key = result_key(r)
+        b = base.get(key)
+        if not b:
+            print("{:<44} new".format(key))
+            continue
+
+        speed = r["ops_per_sec"] / b["ops_per_sec"] if b["ops_per_sec"] else 1
+        line = "{:<44} x{:.2f} speed".format(key, speed)
+        slow = speed < 1 - tolerance
+        big = False
+        if r["peak_bytes"] is not None and b.get("peak_bytes"):
+            mem = r["peak_bytes"] / b["peak_bytes"]
+            line += ", x{:.2f} memory".format(mem)
+            big = mem > 1 + tolerance
+        if slow or big:
+            line += "  REGRESSION"
+            regressions.append(key)
+        print(line)
+    return regressions
+
+
+def incomparable(env, baseline):
+    """
+    Prints the COMPARABLE values of the environment that aren't the same in
+    the baseline one, and returns them
+    """
+    base = baseline.get("environment", {})
+    diff = [k for k in COMPARABLE if env.get(k) != base.get(k)]
+    for k in diff:
+        print("{} is {} but {} in the baseline".format(k, env.get(k), base.get(k)))
+    return diff
+
+
+def environment(args):
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "backend": get_backend(args.backend).name,
+        "auths": args.auths,
+        "workers": args.workers,
+        "exp_bits": args.exp_bits,
+        "batch": args.batch,
+        "seed": args.seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--bits', type=int, nargs='+', default=BITS,
+                        help='Finite field key sizes')
+    parser.add_argument('--curve', nargs='*', default=[],
+                        help='Elliptic curves to benchmark too, like P-256')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Number of ciphertexts of each batch')
+    parser.add_argument('--ops', nargs='+', default=OPS, choices=OPS)
+    parser.add_argument('--auths', type=int, default=2,
+                        help='Auths of multiple_decrypt_shuffle')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Processes used by shuffle and shuffle_decrypt')
+    parser.add_argument('--backend', default=None, help='Arithmetic backend, gmp or python')
+    parser.add_argument('--exp-bits', type=int, default=0,
+                        help='Short exponents, see mixcrypt.exp_bound')
+    parser.add_argument('--batch', action='store_true',
+                        help='Use CiphertextBatch instead of lists')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each case, the best one is reported')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="Don't measure the peak memory")
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the clear messages')
+    parser.add_argument('--out', help='Store the results in this JSON file')
+    parser.add_argument('--baseline', help='Compare with the results of this JSON file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = []
+    for label, group in get_groups(args):
+        for i, size in enumerate(args.sizes):
+            # keygen doesn't depend on the size, it's only run once
+            ops = [op for op in args.ops if op != 'keygen' or not i]
+            for op, n, run in cases(args, label, group, size, ops):
+                r = dict(op=op, bits=label, size=size if op != 'keygen' else n)
+                r.update(measure(args, n, run))
+                print_result(r)
+                results.append(r)
+
+    data = {"environment": environment(args), "results": results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if incomparable(data["environment"], baseline):
+            print("Not compared with the baseline, it was run with other options")
+            return 2
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())